@@ -0,0 +1,313 @@
+"""Latency and throughput benchmarks for LF0, LF1 and LF2.
+
+Runs every handler in-process against the stand-ins in standins.py and
+writes the results as JSON so runs can be compared across commits:
+
+    python benchmarks/run.py --latency lex=40,sqs=10,opensearch=15,dynamodb=5,ses=20 \\
+        --output bench.json --compare baseline.json
+"""
+import argparse
+import contextlib
+import copy
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDAS = os.path.join(HERE, '..', 'lambda-functions')
+sys.path.insert(0, HERE)
+sys.path.insert(0, LAMBDAS)
+
+import standins
+
+CONVERSATIONS = [
+    ['hello', 'I need restaurant suggestions', 'manhattan', 'italian', 'tomorrow',
+     '7pm', '4', 'alice@gmail.com', 'thanks'],
+    ['hi', 'where can I eat', 'boston', 'nyc', 'thai', 'Chinese', 'yesterday', 'tomorrow',
+     '3am', '19:30', '50', '2', 'bob@nowhere.xyz', 'bob@yahoo.com'],
+    ['asdfgh', 'hello', 'thank you'],
+    ['dinner suggestions', 'new york', 'japanese', 'today', '11pm', '6', 'carol@nyu.edu'],
+]
+
+# A full booking over the WebSocket API.
+BOOKING = ['hello', 'I need restaurant suggestions', 'manhattan', 'italian', 'tomorrow',
+           '7pm', '2', 'dana@gmail.com']
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def measure(call, inputs, iterations, warmup, alloc_iterations, units=lambda x: 1):
+    """Runs call(input) over the inputs round-robin. Returns latency
+    percentiles (ms), invocations/s, units/s and allocation figures."""
+    for i in range(warmup):
+        call(inputs[i % len(inputs)]())
+
+    timings, units_done = [], 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        arg = inputs[i % len(inputs)]()
+        t0 = time.perf_counter()
+        call(arg)
+        timings.append((time.perf_counter() - t0) * 1000)
+        units_done += units(arg)
+    elapsed = time.perf_counter() - start
+
+    peaks, nets = [], []
+    tracemalloc.start()
+    for i in range(alloc_iterations):
+        arg = inputs[i % len(inputs)]()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        call(arg)
+        after, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        nets.append(after - before)
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 50), 4),
+        'p95_ms': round(percentile(timings, 95), 4),
+        'p99_ms': round(percentile(timings, 99), 4),
+        'mean_ms': round(statistics.fmean(timings), 4),
+        'invocations_per_s': round(iterations / elapsed, 1),
+        'units_per_s': round(units_done / elapsed, 1),
+        'alloc_peak_kib': round(statistics.fmean(peaks) / 1024, 2) if peaks else None,
+        'alloc_retained_kib': round(statistics.fmean(nets) / 1024, 2) if nets else None,
+    }
+
+def record_lex_events(services):
+    """Captures the Lex V2 events LF1 receives while the conversations run."""
+    events = []
+    fulfil = services.lex.fulfil
+
+    def recording(event):
+        events.append(copy.deepcopy(event))
+        return fulfil(event)
+
+    services.lex.fulfil = recording
+    for n, conversation in enumerate(CONVERSATIONS):
+        for text in conversation:
+            services.lex.recognize_text('bot', 'alias', 'en_US', f'corpus-{n}', text)
+    services.lex.fulfil = fulfil
+    return events
+
+def chat_request(text, ip):
+    return {
+        'body': json.dumps({'messages': [{'type': 'unstructured', 'unstructured': {'text': text}}]}),
+        'requestContext': {'identity': {'sourceIp': ip}},
+    }
+
+def queue_message(n):
+    # Today or tomorrow, so LF2's scheduler handles the message instead of
+    # deferring it.
+    day = datetime.now(timezone.utc) + timedelta(days=n % 2)
+    return {
+        'Cuisine': standins.CUISINES[n % len(standins.CUISINES)],
+        'Location': 'manhattan',
+        'DiningDate': day.strftime('%Y-%m-%d'),
+        'DiningTime': '19:00',
+        'NumberOfPeople': str(2 + n % 5),
+        'Email': f'user{n % 50}@gmail.com',
+    }
+
+def sqs_batch(start, size):
+    return {'Records': [{
+        'messageId': f'm-{start + i}',
+        'receiptHandle': f'r-{start + i}',
+        'body': json.dumps(queue_message(start + i)),
+        'attributes': {'SentTimestamp': str(int(time.time() * 1000)), 'ApproximateReceiveCount': '1'},
+    } for i in range(size)]}
+
+def bench_lf1(lf1, events, args):
+    # LF1 mutates the session attributes of the event, so replay copies.
+    payloads = [json.dumps(e) for e in events]
+    inputs = [lambda p=p: json.loads(p) for p in payloads]
+    return measure(lambda e: lf1.lambda_handler(e, None), inputs,
+                   args.iterations, args.warmup, args.alloc_iterations)
+
+def bench_lf0(lf0, args):
+    inputs = []
+    for n, conversation in enumerate(CONVERSATIONS):
+        for text in conversation:
+            inputs.append(lambda t=text, n=n: chat_request(t, f'10.0.0.{n}'))
+    return measure(lambda e: lf0.lambda_handler(e, None), inputs,
+                   args.iterations, args.warmup, args.alloc_iterations)
+
+def bench_lf2(lf2, args):
+    counter = iter(range(10 ** 9))
+    inputs = [lambda: sqs_batch(next(counter) * args.batch_size, args.batch_size)]
+    result = measure(lambda e: lf2.lambda_handler(e, None), inputs,
+                     max(1, args.iterations // args.batch_size), args.warmup,
+                     args.alloc_iterations, units=lambda e: len(e['Records']))
+    result['messages_per_s'] = result.pop('units_per_s')
+    result['batch_size'] = args.batch_size
+    return result
+
+def queued_records(sqs):
+    """Everything on the stand-in queue, as the SQS event LF2 receives."""
+    messages = sqs.receive_message(QueueUrl='local://queue', MaxNumberOfMessages=len(sqs.queue))
+    return {'Records': [{
+        'messageId': m['MessageId'],
+        'receiptHandle': m['ReceiptHandle'],
+        'body': m['Body'],
+        'attributes': {'SentTimestamp': str(int(time.time() * 1000)), 'ApproximateReceiveCount': '1'},
+    } for m in messages['Messages']]}
+
+def websocket_booking(services, lf2, n):
+    """Connects, books over the socket, runs the queued request through LF2
+    and checks that the delivery status reached the booking's connection,
+    and not a bystander connected from the same address."""
+    ws, ip = services.websocket, '10.1.0.1'
+    bystander = ws.connect(ip)
+    connection_id = ws.connect(ip)
+    for text in BOOKING:
+        ws.send(connection_id, ip, text, session_id=f'bench-session-{n:010d}')
+    lf2.lambda_handler(queued_records(services.sqs), None)
+    statuses = [m for m in ws.inboxes[connection_id] if m['type'] == 'status']
+    leaked = [m for m in ws.inboxes[bystander] if m['type'] == 'status']
+    ws.disconnect(connection_id, ip)
+    ws.disconnect(bystander, ip)
+    if [s['status'] for s in statuses] != ['sent'] or leaked:
+        raise RuntimeError(f'unexpected WebSocket status pushes: {statuses}, bystander {leaked}')
+
+def bench_websocket(lf0, lf2, services, args):
+    # Earlier benchmarks leave requests on the queue.
+    services.sqs.queue.clear()
+    services.websocket.handler = lf0.websocket_handler
+    counter = iter(range(10 ** 9))
+    return measure(lambda n: websocket_booking(services, lf2, n), [lambda: next(counter)],
+                   max(1, args.iterations // len(BOOKING)), args.warmup // len(BOOKING),
+                   args.alloc_iterations // len(BOOKING))
+
+def cold_import_times(modules, repeats):
+    """Imports each module in a fresh interpreter. AWS clients are created
+    lazily, so this measures only the module's own import chain."""
+    times = {}
+    for module in modules:
+        samples = []
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, __file__, '--cold-import', module],
+                                 capture_output=True, text=True)
+            if out.returncode != 0:
+                print(out.stderr, file=sys.stderr)
+                break
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        if samples:
+            times[module] = {'median_ms': round(statistics.median(s['ms'] for s in samples), 2)}
+    return times
+
+def cold_import(module):
+    start = time.perf_counter()
+    importlib.import_module(module)
+    print(json.dumps({'ms': (time.perf_counter() - start) * 1000}))
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f'\nCompared with {baseline_path}:')
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not isinstance(before, dict) or 'p50_ms' not in current:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'invocations_per_s'):
+            if before.get(key):
+                deltas.append(f'{key} {100 * (current[key] - before[key]) / before[key]:+.1f}%')
+        print(f'  {name}: ' + ', '.join(deltas))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', default='',
+        help='injected latency per service in ms, e.g. lex=40,sqs=10,opensearch=15,dynamodb=5,ses=20')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- fraction applied to each latency')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--alloc-iterations', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=10, help='SQS records per LF2 invocation')
+    parser.add_argument('--cold-repeats', type=int, default=3)
+    parser.add_argument('--only', default='lf0,lf1,lf2,ws,cold', help='comma-separated subset to run')
+    parser.add_argument('--corpus', help='JSON list of Lex V2 events to replay through LF1')
+    parser.add_argument('--save-corpus', help='write the recorded Lex V2 events to this file')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help='earlier --output file to compare against')
+    parser.add_argument('--cold-import', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_import:
+        return cold_import(args.cold_import)
+
+    only = set(args.only.split(','))
+    services = standins.install(standins.Services(standins.Latency.parse(args.latency, args.jitter)))
+    os.environ.setdefault('SQS_QUEUE_URL', 'local://queue')
+    os.environ.setdefault('FROM_EMAIL', 'concierge@example.com')
+    os.environ.setdefault('CONNECTIONS_TABLE', standins.CONNECTIONS_TABLE)
+    os.environ.setdefault('WS_ENDPOINT', standins.WS_ENDPOINT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import LF0, LF1, LF2
+    services.lf1 = LF1
+    LF2.es = services.opensearch
+
+    results = {}
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        if args.corpus:
+            with open(args.corpus) as f:
+                events = json.load(f)
+        else:
+            events = record_lex_events(services)
+        if 'lf1' in only:
+            results['lf1'] = bench_lf1(LF1, events, args)
+        if 'lf0' in only:
+            results['lf0'] = bench_lf0(LF0, args)
+        if 'lf2' in only:
+            results['lf2'] = bench_lf2(LF2, args)
+        if 'ws' in only:
+            results['websocket_booking'] = bench_websocket(LF0, LF2, services, args)
+        sink.truncate(0)
+    if args.save_corpus:
+        with open(args.save_corpus, 'w') as f:
+            json.dump(events, f, indent=1)
+    if 'cold' in only:
+        results['cold_import'] = cold_import_times(['LF0', 'LF1', 'LF2'], args.cold_repeats)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'latency_ms': services.latency.ms,
+            'jitter': args.jitter,
+            'lf1_corpus_events': len(events),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f'Saved to {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Table-driven checks of LF1's slot extraction and date/time validation.
+
+Run after touching the extractor patterns or validators; exits non-zero
+when any table has a mismatch:
+
+    python benchmarks/slot_cases.py
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'lambda-functions'))
+# No queue: completed dialogs are answered without enqueueing.
+os.environ.pop('SQS_QUEUE_URL', None)
+os.environ.pop('PRIORITY_QUEUE_URL', None)
+
+import LF1
+
+# (utterance, expected extract_slots result)
+EXTRACT_CASES = [
+    ('italian for 4 tomorrow at 7pm in manhattan, a@gmail.com',
+     {'Email': 'a@gmail.com', 'DiningDate': 'tomorrow', 'DiningTime': '7pm',
+      'NumberOfPeople': '4', 'Cuisine': 'italian', 'Location': 'manhattan'}),
+    ('table for two on March 5th at 19:30',
+     {'DiningDate': 'March 5', 'DiningTime': '19:30', 'NumberOfPeople': '2'}),
+    ('3 people at 7:30 pm on 12/25/2099',
+     {'DiningDate': '12/25/2099', 'DiningTime': '7:30 pm', 'NumberOfPeople': '3'}),
+    ('the 4th of july 2099 for 10 people', {'DiningDate': '4 july 2099', 'NumberOfPeople': '10'}),
+    ('dinner at 8 in soho', {'DiningTime': '8', 'Location': 'soho'}),
+    ('chinese in brooklyn heights', {'Cuisine': 'chinese', 'Location': 'brooklyn heights'}),
+    ('bob@yahoo.com for 6', {'Email': 'bob@yahoo.com', 'NumberOfPeople': '6'}),
+    ('five guests', {'NumberOfPeople': '5'}),
+    ('at 8:00', {'DiningTime': '8:00'}),
+    # Ambiguous aliases are only accepted as a whole answer.
+    ('les', {}),
+    ('hello', {}),
+]
+
+def date_cases(today):
+    """(input, expected validity, expected date or None) relative to today."""
+    return [
+        ('today', True, today),
+        ('Tomorrow', True, today + timedelta(days=1)),
+        ('yesterday', False, None),
+        ('last week', False, None),
+        ('2099-12-25', True, datetime(2099, 12, 25).date()),
+        ('12/25/2099', True, datetime(2099, 12, 25).date()),
+        ('december 25 2099', True, datetime(2099, 12, 25).date()),
+        ('25 dec 2099', True, datetime(2099, 12, 25).date()),
+        ('2020-01-01', False, None),
+        ('feb 30', False, None),
+        ('13/01/2099', False, None),
+        ('someday', False, None),
+    ]
+
+def time_cases(today):
+    """(time, dining date, expected validity)."""
+    tomorrow = (today + timedelta(days=1)).strftime('%Y-%m-%d')
+    return [
+        ('19:00', tomorrow, True),
+        ('01:00', tomorrow, True),
+        ('03:30', tomorrow, False),
+        ('24:00', tomorrow, False),
+        ('7pm', tomorrow, True),
+        ('00:00', today.strftime('%Y-%m-%d'), False),
+    ]
+
+class FixedClock(datetime):
+    """datetime whose now() is pinned, for dialogs that depend on the hour."""
+    pinned = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.pinned.astimezone(tz) if tz else cls.pinned
+
+def dialog(turns):
+    """Runs the turns through LF1's dining handler; returns the last reply
+    and the session attributes."""
+    attrs, reply = {}, None
+    for text in turns:
+        resp = LF1.handle_dining({
+            'invocationSource': 'DialogCodeHook',
+            'inputTranscript': text,
+            'sessionState': {
+                'sessionAttributes': attrs,
+                'intent': {'name': 'DiningSuggestionsIntent', 'slots': {}, 'state': 'InProgress'},
+            },
+        })
+        attrs = resp['sessionState'].get('sessionAttributes') or {}
+        reply = resp['messages'][0]['content']
+    return reply, attrs
+
+# (clock, turns, expected substring of the last reply)
+DIALOG_CASES = [
+    # A time given before the date is re-checked once the date is known.
+    (datetime(2026, 10, 18, 1, 10, tzinfo=LF1.EST),
+     ['italian in manhattan at 1:00am', 'today'], 'already passed today'),
+    (datetime(2026, 10, 18, 1, 10, tzinfo=LF1.EST),
+     ['italian in manhattan at 1:00am', 'tomorrow', '2', 'a@gmail.com'], 'Perfect!'),
+    (datetime(2026, 10, 18, 12, 0, tzinfo=LF1.EST),
+     ['italian for 4 today at 7pm in manhattan, a@gmail.com'], 'Perfect!'),
+    (datetime(2026, 10, 18, 20, 0, tzinfo=LF1.EST),
+     ['italian for 4 today at 7pm in manhattan, a@gmail.com'], 'already passed today'),
+]
+
+def check(name, failures):
+    if failures:
+        print(f'{name}: {len(failures)} failed')
+        for failure in failures:
+            print('  ', failure)
+    else:
+        print(f'{name}: ok')
+    return not failures
+
+def main():
+    ok = check('extract_slots', [
+        (text, got, expected) for text, expected in EXTRACT_CASES
+        if (got := LF1.extract_slots(text)) != expected])
+
+    today = datetime.now(LF1.EST).date()
+    failures = []
+    for value, valid, expected in date_cases(today):
+        is_valid, _, parsed = LF1.validate_date(value)
+        if is_valid != valid or (valid and parsed != expected):
+            failures.append((value, is_valid, parsed))
+    ok &= check('validate_date', failures)
+
+    ok &= check('validate_time', [
+        (value, day, valid) for value, day, valid in time_cases(today)
+        if LF1.validate_time(LF1.parse_time_input(value) or value, day)[0] != valid])
+
+    failures = []
+    real_datetime = LF1.datetime
+    LF1.datetime = FixedClock
+    try:
+        for clock, turns, expected in DIALOG_CASES:
+            FixedClock.pinned = clock
+            reply, _ = dialog(turns)
+            if expected not in reply:
+                failures.append((clock.isoformat(), turns, reply))
+    finally:
+        LF1.datetime = real_datetime
+    ok &= check('dialogs', failures)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
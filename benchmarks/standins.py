@@ -0,0 +1,448 @@
+"""In-process stand-ins for the AWS services the Lambdas call.
+
+Each stand-in sleeps for the configured latency of its service before
+answering, so benchmarks can model network hops without touching AWS.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+
+CUISINES = ['Chinese', 'Italian', 'Japanese', 'Mexican', 'Indian']
+CONNECTIONS_TABLE = 'connections'
+WS_ENDPOINT = 'https://ws.local/test'
+
+class Latency:
+    """Per-service injected latency in milliseconds, e.g. {'lex': 40}.
+    jitter is the +/- fraction applied uniformly to each wait."""
+
+    def __init__(self, ms=None, jitter=0.0):
+        self.ms = dict(ms or {})
+        self.jitter = jitter
+
+    @classmethod
+    def parse(cls, spec, jitter=0.0):
+        ms = {}
+        for part in filter(None, (spec or '').split(',')):
+            name, value = part.split('=')
+            ms[name.strip()] = float(value)
+        return cls(ms, jitter)
+
+    def wait(self, service):
+        ms = self.ms.get(service, 0)
+        if ms > 0:
+            if self.jitter:
+                ms *= 1 + random.uniform(-self.jitter, self.jitter)
+            time.sleep(ms / 1000)
+
+def make_catalog(n=2000, seed=7):
+    rng = random.Random(seed)
+    catalog = {}
+    for i in range(n):
+        biz_id = f'biz-{i:06d}'
+        catalog[biz_id] = {
+            'BusinessID': biz_id,
+            'Name': f'Restaurant {i}',
+            'Address': [f'{rng.randint(1, 999)} Broadway', 'New York, NY 10012'],
+            'Cuisine': CUISINES[i % len(CUISINES)],
+            'Rating': rng.choice([3, 3.5, 4, 4.5, 5]),
+            'NumberOfReviews': rng.randint(0, 3000),
+            'Price': '$' * rng.randint(1, 4),
+            # Spread over the five boroughs' bounding box.
+            'Coordinates': {'latitude': 40.50 + rng.random() * 0.40,
+                            'longitude': -74.25 + rng.random() * 0.55},
+            'ZipCode': f'100{rng.randint(1, 40):02d}',
+        }
+    return catalog
+
+class LocalSQS:
+    def __init__(self, latency):
+        self.latency = latency
+        self.queue = deque()
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.latency.wait('sqs')
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self.queue.append({'MessageId': message_id, 'Body': MessageBody,
+                               'ReceiptHandle': message_id, 'Attributes': kwargs})
+            self.sent += 1
+        return {'MessageId': message_id}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.latency.wait('sqs')
+        successful = []
+        with self._lock:
+            for entry in Entries:
+                message_id = str(uuid.uuid4())
+                self.queue.append({'MessageId': message_id, 'Body': entry['MessageBody'],
+                                   'ReceiptHandle': message_id, 'Attributes': entry})
+                self.sent += 1
+                successful.append({'Id': entry['Id'], 'MessageId': message_id})
+        return {'Successful': successful, 'Failed': []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, **kwargs):
+        self.latency.wait('sqs')
+        with self._lock:
+            n = min(MaxNumberOfMessages, len(self.queue))
+            return {'Messages': [self.queue.popleft() for _ in range(n)]}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.latency.wait('sqs')
+        return {}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        self.latency.wait('sqs')
+        return {}
+
+class LocalTable:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def get_item(self, Key, **kwargs):
+        self.owner.latency.wait('dynamodb')
+        item = self.owner.catalog.get(Key['BusinessID'])
+        return {'Item': item} if item else {}
+
+    def put_item(self, Item, **kwargs):
+        self.owner.latency.wait('dynamodb')
+        self.owner.items.append(Item)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        self.owner.latency.wait('dynamodb')
+        return {}
+
+    def scan(self, **kwargs):
+        self.owner.latency.wait('dynamodb')
+        return {'Items': list(self.owner.catalog.values())}
+
+class LocalItemTable:
+    """A table keyed on the given attributes, for the Lambdas' own tables
+    (e.g. WebSocket connections) rather than the restaurant catalog."""
+
+    def __init__(self, latency, keys):
+        self.latency = latency
+        self.keys = keys
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def get_item(self, Key, **kwargs):
+        self.latency.wait('dynamodb')
+        with self._lock:
+            item = self.items.get(tuple(Key[k] for k in self.keys))
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item, **kwargs):
+        self.latency.wait('dynamodb')
+        with self._lock:
+            self.items[tuple(Item[k] for k in self.keys)] = dict(Item)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        self.latency.wait('dynamodb')
+        with self._lock:
+            self.items.pop(tuple(Key[k] for k in self.keys), None)
+        return {}
+
+class LocalDynamoDB:
+    def __init__(self, latency, catalog):
+        self.latency = latency
+        self.catalog = catalog
+        self.items = []
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.get(name) or LocalTable(self)
+
+    def batch_get_item(self, RequestItems):
+        self.latency.wait('dynamodb')
+        responses = {}
+        for table, request in RequestItems.items():
+            responses[table] = [self.catalog[k['BusinessID']] for k in request['Keys']
+                                if k['BusinessID'] in self.catalog]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+class ClientError(Exception):
+    """Carries an error code the way botocore's ClientError does."""
+
+    def __init__(self, code, message=''):
+        super().__init__(f'{code}: {message}')
+        self.response = {'Error': {'Code': code, 'Message': message}}
+
+TAG_RE = re.compile(r'{{({\w+}|#each (\w+)|/each|\w+)}}')
+HTML_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+                "'": '&#x27;', '`': '&#x60;', '=': '&#x3D;'}
+
+def render_template(template, data):
+    """Renders the Handlebars subset the SES templates here use: {{name}}
+    and {{this}} (HTML-escaped, as SES does), {{{name}}} (raw) and nested
+    {{#each list}}...{{/each}}."""
+    out, pos = [], 0
+    while True:
+        match = TAG_RE.search(template, pos)
+        if not match:
+            return ''.join(out) + template[pos:]
+        out.append(template[pos:match.start()])
+        tag = match.group(1)
+        if tag.startswith('#each'):
+            depth, end = 1, match.end()
+            while depth:
+                inner = TAG_RE.search(template, end)
+                if inner.group(1) == '/each':
+                    depth -= 1
+                elif inner.group(1).startswith('#each'):
+                    depth += 1
+                end = inner.end()
+            body = template[match.end():inner.start()]
+            out.extend(render_template(body, item) for item in data.get(match.group(2), []))
+            pos = end
+        else:
+            name = tag.strip('{}')
+            value = str(data if name == 'this' else data.get(name, ''))
+            if not tag.startswith('{'):
+                value = ''.join(HTML_ESCAPES.get(c, c) for c in value)
+            out.append(value)
+            pos = match.end()
+
+class LocalSES:
+    """Records sent emails. throttle_rate is the fraction of templated sends
+    answered with a throttling status, to exercise the retry path."""
+
+    def __init__(self, latency, throttle_rate=0.0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.sent = []
+        self.templates = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send_email(self, Source, Destination, Message, **kwargs):
+        self.latency.wait('ses')
+        with self._lock:
+            self.calls += 1
+            self.sent.append((Destination['ToAddresses'], Message))
+        return {'MessageId': str(uuid.uuid4())}
+
+    def get_template(self, TemplateName):
+        self.latency.wait('ses')
+        if TemplateName not in self.templates:
+            raise ClientError('TemplateDoesNotExist', TemplateName)
+        return {'Template': self.templates[TemplateName]}
+
+    def create_template(self, Template):
+        self.latency.wait('ses')
+        with self._lock:
+            if Template['TemplateName'] in self.templates:
+                raise ClientError('AlreadyExists', Template['TemplateName'])
+            self.templates[Template['TemplateName']] = Template
+        return {}
+
+    def _deliver(self, to, template_name, data):
+        template = self.templates.get(template_name)
+        if template is None:
+            return 'TemplateDoesNotExist'
+        if random.random() < self.throttle_rate:
+            return 'AccountThrottled'
+        self.sent.append((to, {'Subject': {'Data': render_template(template['SubjectPart'], data)},
+                               'Body': {'Text': {'Data': render_template(template['TextPart'], data)}}}))
+        return 'Success'
+
+    def send_templated_email(self, Source, Destination, Template, TemplateData, **kwargs):
+        self.latency.wait('ses')
+        with self._lock:
+            self.calls += 1
+            status = self._deliver(Destination['ToAddresses'], Template, json.loads(TemplateData))
+        if status != 'Success':
+            raise ClientError('Throttling' if status == 'AccountThrottled' else status)
+        return {'MessageId': str(uuid.uuid4())}
+
+    def send_bulk_templated_email(self, Source, Template, Destinations, DefaultTemplateData='{}', **kwargs):
+        self.latency.wait('ses')
+        if len(Destinations) > 50:
+            raise ClientError('InvalidParameterValue', 'at most 50 destinations')
+        default = json.loads(DefaultTemplateData)
+        statuses = []
+        with self._lock:
+            self.calls += 1
+            for d in Destinations:
+                data = json.loads(d.get('ReplacementTemplateData') or 'null') or default
+                status = self._deliver(d['Destination']['ToAddresses'], Template, data)
+                statuses.append({'Status': status, 'MessageId': str(uuid.uuid4())}
+                                if status == 'Success' else {'Status': status, 'Error': status})
+        return {'Status': statuses}
+
+class LocalOpenSearch:
+    """Answers the queries LF2 sends (term/match on Cuisine, optional
+    geo_distance filter, optional function_score random sampling) from the
+    catalog."""
+
+    def __init__(self, latency, catalog):
+        self.latency = latency
+        self.by_cuisine = {}
+        for item in catalog.values():
+            source = {'RestaurantID': item['BusinessID'], 'Cuisine': item['Cuisine'],
+                      'Details': {k: item[k] for k in ('Name', 'Address', 'Rating',
+                                  'NumberOfReviews', 'Price', 'Coordinates')}}
+            self.by_cuisine.setdefault(item['Cuisine'], []).append(source)
+
+    def search(self, index, query):
+        self.latency.wait('opensearch')
+        q = query['query']
+        if 'function_score' in q:
+            q = q['function_score']['query']
+        clauses = q['bool']['filter'] if 'bool' in q else [q]
+        docs = []
+        for clause in clauses:
+            if 'term' in clause or 'match' in clause:
+                docs = self.by_cuisine.get((clause.get('term') or clause['match'])['Cuisine'], [])
+        for clause in clauses:
+            if 'geo_distance' in clause:
+                docs = [d for d in docs if self.within(d, clause['geo_distance'])]
+        size = query.get('size', 10)
+        docs = random.sample(docs, min(size, len(docs))) if 'function_score' in query['query'] else docs[:size]
+        fields = query.get('_source')
+        if fields:
+            docs = [{k: d[k] for k in fields if k in d} for d in docs]
+        return [{'_source': d} for d in docs]
+
+    @staticmethod
+    def within(doc, spec):
+        import geo
+        point = doc['Details']['Coordinates']
+        radius_km = float(spec['distance'].rstrip('km'))
+        return geo.distance_km(spec['Location']['lat'], spec['Location']['lon'],
+                               point['latitude'], point['longitude']) <= radius_km
+
+class LocalLex:
+    """Stand-in for lexv2-runtime. Classifies the text with a few keyword
+    rules, keeps per-session dialog state and fulfils through LF1's handler,
+    so driving LF0 exercises the whole synchronous path."""
+
+    GREETINGS = {'hi', 'hello', 'hey'}
+    THANKS = {'thanks', 'thank you', 'thx'}
+
+    def __init__(self, latency, fulfil):
+        self.latency = latency
+        self.fulfil = fulfil
+        self.sessions = {}
+
+    def classify(self, text, session):
+        lowered = text.lower().strip()
+        if session.get('intent'):
+            return session['intent']
+        if lowered in self.GREETINGS:
+            return 'GreetingIntent'
+        if lowered in self.THANKS:
+            return 'ThankYouIntent'
+        if any(w in lowered for w in ('food', 'restaurant', 'eat', 'dine', 'dinner', 'suggest')):
+            return 'DiningSuggestionsIntent'
+        return 'FallbackIntent'
+
+    def recognize_text(self, botId, botAliasId, localeId, sessionId, text, **kwargs):
+        self.latency.wait('lex')
+        session = self.sessions.setdefault(sessionId, {'attrs': {}})
+        intent = self.classify(text, session)
+        event = {
+            'sessionId': sessionId,
+            'inputTranscript': text,
+            'invocationSource': 'DialogCodeHook',
+            'requestAttributes': kwargs.get('requestAttributes') or {},
+            'sessionState': {
+                'sessionAttributes': dict(session['attrs']),
+                'intent': {'name': intent, 'slots': {}, 'state': 'InProgress'},
+            },
+        }
+        resp = self.fulfil(event)
+        state = resp.get('sessionState', {})
+        session['attrs'] = state.get('sessionAttributes') or {}
+        if state.get('dialogAction', {}).get('type') == 'Close':
+            self.sessions.pop(sessionId, None)
+        else:
+            session['intent'] = intent
+        return {'messages': resp.get('messages', []), 'sessionState': state, 'sessionId': sessionId}
+
+    def delete_session(self, botId, botAliasId, localeId, sessionId):
+        self.latency.wait('lex')
+        self.sessions.pop(sessionId, None)
+        return {}
+
+class LocalWebSocketGateway:
+    """Stand-in for a WebSocket API and its apigatewaymanagementapi client.
+    connect/send/disconnect drive a handler the way API Gateway does; what
+    the Lambdas post to a connection lands in its inbox."""
+
+    DOMAIN, STAGE = 'ws.local', 'test'
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.handler = None
+        self.inboxes = {}
+        self._lock = threading.Lock()
+
+    def event(self, route, connection_id, ip, body=None):
+        return {
+            'requestContext': {'routeKey': route, 'connectionId': connection_id,
+                               'domainName': self.DOMAIN, 'stage': self.STAGE,
+                               'identity': {'sourceIp': ip}},
+            'body': body,
+        }
+
+    def connect(self, ip):
+        connection_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self.inboxes[connection_id] = []
+        self.handler(self.event('$connect', connection_id, ip), None)
+        return connection_id
+
+    def send(self, connection_id, ip, text, session_id=None):
+        body = {'messages': [{'type': 'unstructured', 'unstructured': {'text': text}}]}
+        if session_id:
+            body['sessionId'] = session_id
+        return self.handler(self.event('$default', connection_id, ip, json.dumps(body)), None)
+
+    def disconnect(self, connection_id, ip):
+        with self._lock:
+            self.inboxes.pop(connection_id, None)
+        self.handler(self.event('$disconnect', connection_id, ip), None)
+
+    def post_to_connection(self, ConnectionId, Data):
+        self.latency.wait('apigateway')
+        with self._lock:
+            inbox = self.inboxes.get(ConnectionId)
+            if inbox is None:
+                raise ClientError('GoneException', f'{ConnectionId} is gone')
+            inbox.append(json.loads(Data))
+        return {}
+
+class Services:
+    def __init__(self, latency=None, catalog=None):
+        self.latency = latency or Latency()
+        self.catalog = catalog or make_catalog()
+        self.sqs = LocalSQS(self.latency)
+        self.dynamodb = LocalDynamoDB(self.latency, self.catalog)
+        self.dynamodb.tables[CONNECTIONS_TABLE] = LocalItemTable(self.latency, ['ConnectionId'])
+        self.websocket = LocalWebSocketGateway(self.latency)
+        self.ses = LocalSES(self.latency)
+        self.opensearch = LocalOpenSearch(self.latency, self.catalog)
+        self.lex = LocalLex(self.latency, self._fulfil)
+        self.lf1 = None
+
+    def _fulfil(self, event):
+        return self.lf1.lambda_handler(event, None)
+
+def install(services):
+    """Registers the stand-ins with the Lambdas' lazy client registry, so no
+    real boto3 client is ever created."""
+    import aws_clients
+    aws_clients.override('sqs', services.sqs)
+    aws_clients.override('ses', services.ses)
+    aws_clients.override('lexv2-runtime', services.lex)
+    aws_clients.override('apigatewaymanagementapi', services.websocket)
+    aws_clients.override('dynamodb', services.dynamodb, kind='resource')
+    return services
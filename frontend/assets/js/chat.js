@@ -27,16 +27,70 @@ $(document).ready(function() {
 
   function callChatbotApi(message) {
     // params, body, additionalParams
-    return sdk.chatbotPost({}, {
+    return sdk.chatbotPost({}, chatBody(message), {});
+  }
+
+  function chatBody(message) {
+    return {
+      sessionId: sessionId,
       messages: [{
         type: 'unstructured',
         unstructured: {
           text: message
         }
       }]
-    }, {});
+    };
+  }
+
+  // WebSocket mode: replies and delivery status arrive on one connection,
+  // which is reopened with backoff when it drops. Messages typed while it is
+  // down go over REST instead.
+  var socket = null,
+    socketRetry = 1000,
+    sessionId = chatSessionId();
+
+  // Random per-tab id that keeps the bot dialog across reconnects and
+  // across the REST fallback.
+  function chatSessionId() {
+    var id = window.sessionStorage && sessionStorage.getItem('chatSessionId');
+    if (!id) {
+      var bytes = new Uint8Array(16);
+      window.crypto.getRandomValues(bytes);
+      id = Array.prototype.map.call(bytes, function(b) {
+        return ('0' + b.toString(16)).slice(-2);
+      }).join('');
+      if (window.sessionStorage) {
+        sessionStorage.setItem('chatSessionId', id);
+      }
+    }
+    return id;
+  }
+
+  function connectSocket() {
+    if (typeof wsUrl === 'undefined' || !wsUrl || !window.WebSocket) {
+      return;
+    }
+    socket = new WebSocket(wsUrl);
+    socket.onopen = function() {
+      socketRetry = 1000;
+    };
+    socket.onmessage = function(event) {
+      var data = JSON.parse(event.data);
+      if (data.type === 'reply') {
+        renderMessages(data.messages);
+      } else if (data.type === 'status') {
+        insertResponseMessage(data.text);
+      }
+    };
+    socket.onclose = function() {
+      socket = null;
+      setTimeout(connectSocket, socketRetry);
+      socketRetry = Math.min(socketRetry * 2, 30000);
+    };
   }
 
+  connectSocket();
+
   function insertMessage() {
     msg = $('.message-input').val();
     if ($.trim(msg) == '') {
@@ -47,39 +101,15 @@ $(document).ready(function() {
     $('.message-input').val(null);
     updateScrollbar();
 
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify(chatBody(msg)));
+      return;
+    }
+
     callChatbotApi(msg)
       .then((response) => {
         console.log(response);
-        var data = response.data;
-
-        if (data.messages && data.messages.length > 0) {
-          console.log('received ' + data.messages.length + ' messages');
-
-          var messages = data.messages;
-
-          for (var message of messages) {
-            if (message.type === 'unstructured') {
-              insertResponseMessage(message.unstructured.text);
-            } else if (message.type === 'structured' && message.structured.type === 'product') {
-              var html = '';
-
-              insertResponseMessage(message.structured.text);
-
-              setTimeout(function() {
-                html = '<img src="' + message.structured.payload.imageUrl + '" witdth="200" height="240" class="thumbnail" /><b>' +
-                  message.structured.payload.name + '<br>$' +
-                  message.structured.payload.price +
-                  '</b><br><a href="#" onclick="' + message.structured.payload.clickAction + '()">' +
-                  message.structured.payload.buttonLabel + '</a>';
-                insertResponseMessage(html);
-              }, 1100);
-            } else {
-              console.log('not implemented');
-            }
-          }
-        } else {
-          insertResponseMessage('Oops, something went wrong. Please try again.');
-        }
+        renderMessages(response.data.messages);
       })
       .catch((error) => {
         console.log('an error occurred', error);
@@ -87,6 +117,35 @@ $(document).ready(function() {
       });
   }
 
+  function renderMessages(messages) {
+    if (!messages || messages.length === 0) {
+      insertResponseMessage('Oops, something went wrong. Please try again.');
+      return;
+    }
+    console.log('received ' + messages.length + ' messages');
+
+    for (var message of messages) {
+      if (message.type === 'unstructured') {
+        insertResponseMessage(message.unstructured.text);
+      } else if (message.type === 'structured' && message.structured.type === 'product') {
+        var html = '';
+
+        insertResponseMessage(message.structured.text);
+
+        setTimeout(function() {
+          html = '<img src="' + message.structured.payload.imageUrl + '" witdth="200" height="240" class="thumbnail" /><b>' +
+            message.structured.payload.name + '<br>$' +
+            message.structured.payload.price +
+            '</b><br><a href="#" onclick="' + message.structured.payload.clickAction + '()">' +
+            message.structured.payload.buttonLabel + '</a>';
+          insertResponseMessage(html);
+        }, 1100);
+      } else {
+        console.log('not implemented');
+      }
+    }
+  }
+
   $('.message-submit').click(function() {
     insertMessage();
   });
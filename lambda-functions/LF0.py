@@ -1,64 +1,221 @@
 import json
-import boto3
 import os
+import re
+import time
 
-lex = boto3.client('lexv2-runtime', region_name='us-east-1')
+import quick_replies
+from aws_clients import client
+from connections import ConnectionRegistry, endpoint_of
+from instrument import Metrics, log_event
+from profiling import profiled
+from ttl_cache import TTLCache
 
 BOT_ID       = os.environ.get('BOT_ID', '')
 BOT_ALIAS_ID = os.environ.get('BOT_ALIAS_ID', '')
 LOCALE_ID    = 'en_US'
 
-def lambda_handler(event, context):
-    print('Event:', json.dumps(event))
-    body = event.get('body', '{}')
-    if isinstance(body, str):
-        body = json.loads(body)
+# Greetings, thanks and input without any words are answered here instead of
+# round-tripping through Lex and LF1, but only when this container has not
+# seen the session mid-dialog. Lex drops idle sessions after five minutes by
+# default, so a dialog is forgotten after the same time.
+LOCAL_FAST_PATH  = os.environ.get('LOCAL_FAST_PATH', '1') == '1'
+DIALOG_IDLE_TTL  = int(os.environ.get('DIALOG_IDLE_TTL', '300'))
+DIALOG_CACHE_SIZE = int(os.environ.get('DIALOG_CACHE_SIZE', '4096'))
 
-    messages = body.get('messages', [])
-    user_text = 'Hello'
-    if messages:
-        msg = messages[0]
-        user_text = msg.get('unstructured', {}).get('text', 'Hello')
+# API Gateway gives up after 29 s; keep the whole request well inside that.
+REQUEST_BUDGET_MS = int(os.environ.get('REQUEST_BUDGET_MS', '25000'))
+MIN_RESERVE_MS    = int(os.environ.get('MIN_RESERVE_MS', '1000'))
 
-    
-    ip = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'default')
-    session_id = f'session-{ip}'.replace('.', '-')
+metrics = Metrics('LF0')
+registry = ConnectionRegistry()
+
+# Sessions this container has seen mid-dialog. Bounded, so abandoned chats
+# age out instead of growing the dict for the life of the container.
+active_dialogs = TTLCache(maxsize=DIALOG_CACHE_SIZE, ttl=DIALOG_IDLE_TTL)
+fast_path_stats = {'hits': 0, 'misses': 0}
+
+def dialog_in_progress(session_id):
+    return active_dialogs.get(session_id, False)
+
+def answer_locally(session_id, user_text):
+    if not LOCAL_FAST_PATH or dialog_in_progress(session_id):
+        return None
+    match = quick_replies.classify(user_text)
+    if match:
+        fast_path_stats['hits'] += 1
+        metrics.count('FastPathHits')
+    else:
+        fast_path_stats['misses'] += 1
+        metrics.count('FastPathMisses')
+    return match
+
+def fast_path_hit_rate():
+    total = fast_path_stats['hits'] + fast_path_stats['misses']
+    return fast_path_stats['hits'] / total if total else 0.0
+
+ERROR_REPLY = 'Oops, something went wrong. Please try again.'
+
+def bot_messages(texts):
+    return [{'type': 'unstructured', 'unstructured': {'text': t}} for t in texts]
 
-    lex_resp = lex.recognize_text(
-        botId=BOT_ID, botAliasId=BOT_ALIAS_ID,
-        localeId=LOCALE_ID, sessionId=session_id, text=user_text
-    )
+def response(texts):
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
+        },
+        'body': json.dumps({'messages': bot_messages(texts)})
+    }
+
+def converse(session_id, user_text, request_attributes=None):
+    """Sends one user message through the bot; returns the reply texts.
+    request_attributes reach LF1 as the event's requestAttributes."""
+    local = answer_locally(session_id, user_text)
+    if local:
+        intent, reply = local
+        print(f'Answered {intent} locally (fast path hit rate {fast_path_hit_rate():.0%})')
+        return [reply]
+
+    extra = {'requestAttributes': request_attributes} if request_attributes else {}
+    with metrics.timer('LexRecognizeText'):
+        lex_resp = client('lexv2-runtime').recognize_text(
+            botId=BOT_ID, botAliasId=BOT_ALIAS_ID,
+            localeId=LOCALE_ID, sessionId=session_id, text=user_text, **extra
+        )
 
-    bot_messages = lex_resp.get('messages', [])
-    bot_text = "I'm still working on it. Please try again."
-    if bot_messages:
-        bot_text = bot_messages[0].get('content', bot_text)
+    bot_texts = [m['content'] for m in lex_resp.get('messages', []) if m.get('content')]
+    if not bot_texts:
+        bot_texts = ["I'm still working on it. Please try again."]
 
     
     session_state = lex_resp.get('sessionState', {})
     dialog_action = session_state.get('dialogAction', {})
     intent_state = session_state.get('intent', {}).get('state', '')
 
+    if dialog_action.get('type') == 'Close':
+        active_dialogs.pop(session_id, None)
+    else:
+        active_dialogs.set(session_id, True)
+
     if dialog_action.get('type') == 'Close' and intent_state == 'Fulfilled':
         try:
-            lex.delete_session(
-                botId=BOT_ID,
-                botAliasId=BOT_ALIAS_ID,
-                localeId=LOCALE_ID,
-                sessionId=session_id
-            )
+            with metrics.timer('LexDeleteSession'):
+                client('lexv2-runtime').delete_session(
+                    botId=BOT_ID,
+                    botAliasId=BOT_ALIAS_ID,
+                    localeId=LOCALE_ID,
+                    sessionId=session_id
+                )
             print(f'Session {session_id} deleted after fulfillment')
         except Exception as e:
             print(f'Could not delete session: {str(e)}')
 
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
-        },
-        'body': json.dumps({
-            'messages': [{'type': 'unstructured', 'unstructured': {'text': bot_text}}]
-        })
-    }
\ No newline at end of file
+    return bot_texts
+
+def remaining_ms(context, deadline):
+    remaining = (deadline - time.monotonic()) * 1000
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        remaining = min(remaining, context.get_remaining_time_in_millis())
+    return remaining
+
+@profiled('LF0')
+def lambda_handler(event, context):
+    log_event(event)
+    with metrics.invocation():
+        return handle_request(event, context)
+
+def message_texts(body):
+    if isinstance(body, str):
+        body = json.loads(body or '{}')
+    messages = body.get('messages', [])
+    return [m.get('unstructured', {}).get('text', 'Hello') for m in messages] or ['Hello']
+
+def session_of(event):
+    ip = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'default')
+    return f'session-{ip}'.replace('.', '-')
+
+CLIENT_SESSION_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+def client_session_of(body):
+    """Lex session for the random per-tab id chat.js sends as sessionId,
+    shared by its REST and WebSocket messages so switching between them
+    keeps the dialog; None when the body has no valid id."""
+    client_id = str(body.get('sessionId', '')) if isinstance(body, dict) else ''
+    if CLIENT_SESSION_RE.match(client_id):
+        return f'chat-{client_id}'
+    return None
+
+def reply_to(session_id, texts, context, request_attributes=None):
+    """Runs the messages through the bot; returns all reply texts."""
+    deadline = time.monotonic() + REQUEST_BUDGET_MS / 1000
+
+    # Messages are handled in order against the same session. Stop before one
+    # that might not finish in time: the reserve grows with the slowest
+    # message seen so far in this request.
+    replies, slowest = [], 0.0
+    for i, text in enumerate(texts):
+        if i and remaining_ms(context, deadline) < max(MIN_RESERVE_MS, 2 * slowest):
+            skipped = len(texts) - i
+            metrics.count('MessagesSkipped', skipped)
+            print(f'Time budget exhausted, skipping {skipped} of {len(texts)} messages')
+            replies.append(f"Sorry, I ran out of time before reading your last {skipped} "
+                           f"message{'s' if skipped > 1 else ''}. Please send "
+                           f"{'them' if skipped > 1 else 'it'} again.")
+            break
+        started = time.monotonic()
+        replies.extend(converse(session_id, text, request_attributes))
+        slowest = max(slowest, (time.monotonic() - started) * 1000)
+    return replies
+
+def handle_request(event, context):
+    body = event.get('body', '{}')
+    if isinstance(body, str):
+        body = json.loads(body or '{}')
+    texts = message_texts(body)
+    return response(reply_to(client_session_of(body) or session_of(event), texts, context))
+
+@profiled('LF0-ws')
+def websocket_handler(event, context):
+    """Handler for the WebSocket API: routes $connect, $disconnect and
+    $default (or a 'sendmessage' action). Messages carry the same body as
+    POST /chatbot plus an optional sessionId; replies are pushed back as
+    {'type': 'reply', ...}, and LF2 later pushes delivery status to the
+    connection the booking was made on."""
+    log_event(event)
+    with metrics.invocation():
+        return handle_socket_event(event, context)
+
+def handle_socket_event(event, context):
+    ctx = event.get('requestContext', {})
+    route, connection_id = ctx.get('routeKey'), ctx.get('connectionId')
+
+    if route == '$connect':
+        with metrics.timer('ConnectionRegistry'):
+            registry.add(connection_id)
+        return {'statusCode': 200}
+    if route == '$disconnect':
+        with metrics.timer('ConnectionRegistry'):
+            registry.remove(connection_id)
+        return {'statusCode': 200}
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+        texts = message_texts(body)
+    except (ValueError, AttributeError):
+        body, texts = {}, ['']
+    # Never the source IP, which many WebSocket clients can share.
+    session_id = client_session_of(body) or f'ws-{connection_id}'
+    try:
+        replies = reply_to(session_id, texts, context,
+                           {'channel': 'websocket', 'connectionId': connection_id})
+    except Exception as e:
+        # The page waits for a pushed reply, so an error must produce one.
+        print(f'Could not answer {connection_id}: {str(e)}')
+        metrics.count('ReplyErrors')
+        replies = [ERROR_REPLY]
+    with metrics.timer('WebSocketPush'):
+        registry.send(connection_id, {'type': 'reply', 'messages': bot_messages(replies)},
+                      endpoint=endpoint_of(event))
+    return {'statusCode': 200}
@@ -1,23 +1,112 @@
-import json
-import boto3
 import os
 import re
 from datetime import datetime, date, timedelta
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
-sqs = boto3.client('sqs', region_name='us-east-1')
+import geo
+from aws_clients import client
+from enqueue import Enqueuer, dedup_key
+from instrument import Metrics, log_event
+from profiling import profiled
+from quick_replies import GREETING_REPLY, THANKYOU_REPLY, FALLBACK_REPLY
+from scheduler import Scheduler
+
 SQS_QUEUE_URL = os.environ.get('SQS_QUEUE_URL', '')
+OUTBOX_PATH = os.environ.get('OUTBOX_PATH', '/tmp/lf1-outbox.jsonl')
+DEDUP_WINDOW = int(os.environ.get('DEDUP_WINDOW', '600'))
+
+# Sends that still fail after retries wait in OUTBOX_PATH and are replayed
+# on the next invocation of this container.
+enqueuer = Enqueuer(SQS_QUEUE_URL, lambda: client('sqs'), OUTBOX_PATH,
+                    dedup_window=DEDUP_WINDOW) if SQS_QUEUE_URL else None
+
+# Optional second queue, with its own LF2 event source mapping, for bookings
+# in the scheduler's priority lane (same day or within PRIORITY_WINDOW_HOURS).
+PRIORITY_QUEUE_URL = os.environ.get('PRIORITY_QUEUE_URL', '')
+priority_enqueuer = Enqueuer(PRIORITY_QUEUE_URL, lambda: client('sqs'), f'{OUTBOX_PATH}.priority',
+                             dedup_window=DEDUP_WINDOW) if PRIORITY_QUEUE_URL else None
+scheduler = Scheduler(priority_window=float(os.environ.get('PRIORITY_WINDOW_HOURS', '6')) * 3600)
+
+def enqueuer_for(body):
+    if priority_enqueuer and scheduler.lane(body) == 'priority':
+        return priority_enqueuer
+    return enqueuer
+
+metrics = Metrics('LF1')
 
 EST = ZoneInfo('America/New_York')
 
-VALID_EMAIL_DOMAINS = [
+VALID_EMAIL_DOMAINS = frozenset([
     'gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'icloud.com',
     'aol.com', 'protonmail.com', 'nyu.edu', 'hotmail.co.uk', 'yahoo.co.uk',
     'live.com', 'msn.com', 'me.com', 'mac.com', 'googlemail.com'
+])
+
+# Locations are resolved through geo.GAZETTEER (the five boroughs and their
+# main neighborhoods). Short aliases that are also ordinary words are only
+# accepted as a whole answer, never picked out of a longer sentence.
+AMBIGUOUS_LOCATIONS = frozenset(['si', 'bk', 'les'])
+VALID_CUISINES = frozenset(['chinese', 'italian', 'japanese', 'mexican', 'indian'])
+
+TRIGGER_WORDS = ['nearby', 'places', 'restaurant', 'food', 'eat',
+                 'dine', 'dinner', 'lunch', 'breakfast', 'suggestions',
+                 'help', 'hungry', 'recommend']
+# One pass over the input finds any trigger word (substring match, like `in`).
+TRIGGER_RE = re.compile('|'.join(map(re.escape, TRIGGER_WORDS)))
+
+EMAIL_RE     = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+TIME_24H_RE  = re.compile(r'^\d{1,2}:\d{2}$')
+TIME_AMPM_RE = re.compile(r'^(\d{1,2})(?::(\d{2}))?\s*(am|pm)$')
+TIME_HOUR_RE = re.compile(r'^(\d{1,2})$')
+
+DATE_ISO_RE       = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+DATE_SLASH_RE     = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})$')
+DATE_MONTH_DAY_RE = re.compile(r'^([a-z]+)\s+(\d{1,2})(?:\s+(\d{4}))?$')
+DATE_DAY_MONTH_RE = re.compile(r'^(\d{1,2})\s+([a-z]+)(?:\s+(\d{4}))?$')
+
+MONTHS = {}
+for _n, _name in enumerate(['january', 'february', 'march', 'april', 'may', 'june', 'july',
+                            'august', 'september', 'october', 'november', 'december'], 1):
+    MONTHS[_name] = MONTHS[_name[:3]] = _n
+
+PAST_DATE_WORDS = frozenset(['yesterday', 'last week', 'last month'])
+PAST_DATE_MSG = "Sorry, I can't make reservations for past dates."
+
+# Unanchored patterns used to pull several slots out of one utterance, e.g.
+# "italian for 4 tomorrow at 7pm in manhattan, a@gmail.com". They are applied
+# in EXTRACTORS order and each match is blanked out before the next pattern
+# runs, so the digits of a date or time are never read as a party size.
+_MONTH_NAMES = '|'.join(sorted(MONTHS, key=len, reverse=True))
+_NUMBER_WORDS = ['one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten',
+                 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen', 'sixteen',
+                 'seventeen', 'eighteen', 'nineteen', 'twenty']
+NUMBER_WORDS = {w: str(n) for n, w in enumerate(_NUMBER_WORDS, 1)}
+_COUNT = r'(\d{1,3}|' + '|'.join(_NUMBER_WORDS) + r')'
+
+EXTRACTORS = [
+    ('Email', re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')),
+    ('DiningDate', re.compile(
+        r'\b(today|tomorrow|yesterday|last week|last month'
+        r'|\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}/(?:\d{4}|\d{2})'
+        rf'|(?:{_MONTH_NAMES})\.?\s+\d{{1,2}}(?:st|nd|rd|th)?(?:,?\s+\d{{4}})?'
+        rf'|\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?(?:{_MONTH_NAMES})(?:,?\s+\d{{4}})?)\b',
+        re.IGNORECASE)),
+    ('DiningTime', re.compile(
+        r'\b(\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2})(?![\w:])'
+        r'|\bat\s+(\d{1,2})\b(?!\s*(?:am|pm)|[:/])',
+        re.IGNORECASE)),
+    ('NumberOfPeople', re.compile(
+        rf'\b(?:for|party of|table for)\s+{_COUNT}\b(?!\s*(?:am|pm|:))'
+        rf'|\b{_COUNT}\s+(?:people|persons|person|guests|of us)\b',
+        re.IGNORECASE)),
+    ('Cuisine', re.compile(r'\b(' + '|'.join(sorted(VALID_CUISINES)) + r')\b', re.IGNORECASE)),
+    ('Location', re.compile(
+        r'\b(' + '|'.join(re.escape(name) for name in sorted(
+            geo.GAZETTEER.keys() - AMBIGUOUS_LOCATIONS, key=len, reverse=True)) + r')(?!\w)',
+        re.IGNORECASE)),
 ]
-
-VALID_LOCATIONS = ['manhattan', 'new york', 'nyc', 'new york city', 'ny']
-VALID_CUISINES = ['chinese', 'italian', 'japanese', 'mexican', 'indian']
+DATE_SUFFIX_RE = re.compile(r'(?<=\d)(st|nd|rd|th)\b|\bof\s+|,|\.', re.IGNORECASE)
 
 def close(session_attrs, intent_name, fulfillment_state, message):
     return {
@@ -55,14 +144,35 @@ def get_slot_value(slots, name):
     return None
 
 def validate_email(email):
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    if not re.match(email_pattern, email):
+    if not EMAIL_RE.match(email):
         return False, "That doesn't look like a valid email address. Please enter a valid one."
     domain = email.split('@')[1].lower()
     if domain not in VALID_EMAIL_DOMAINS:
         return False, f"I don't recognize '{domain}' as a valid email domain."
     return True, None
 
+@lru_cache(maxsize=1024)
+def parse_date_shape(value):
+    """Parses a normalized date string by dispatching on its shape.
+    Returns (year or None, month, day), or None if it is not a date."""
+    match = DATE_ISO_RE.match(value)
+    if match:
+        return tuple(int(g) for g in match.groups())
+    match = DATE_SLASH_RE.match(value)
+    if match:
+        month, day, year = match.groups()
+        year = int(year) if len(year) == 4 else datetime.strptime(year, '%y').year
+        return year, int(month), int(day)
+    match = DATE_MONTH_DAY_RE.match(value)
+    if match and match.group(1) in MONTHS:
+        month, day, year = match.groups()
+        return (int(year) if year else None), MONTHS[month], int(day)
+    match = DATE_DAY_MONTH_RE.match(value)
+    if match and match.group(2) in MONTHS:
+        day, month, year = match.groups()
+        return (int(year) if year else None), MONTHS[month], int(day)
+    return None
+
 def validate_date(value):
     """Returns (is_valid, error_message, parsed_date)"""
     value_lower = value.lower().strip()
@@ -72,44 +182,33 @@ def validate_date(value):
         return True, None, today
     elif value_lower == 'tomorrow':
         return True, None, today + timedelta(days=1)
-    elif value_lower in ['yesterday', 'last week', 'last month']:
-        return False, "Sorry, I can't make reservations for past dates.", None
-
-    
-    try:
-        parsed = datetime.strptime(value, '%Y-%m-%d').date()
-        if parsed < today:
-            return False, "Sorry, I can't make reservations for past dates.", None
-        return True, None, parsed
-    except ValueError:
-        pass
+    elif value_lower in PAST_DATE_WORDS:
+        return False, PAST_DATE_MSG, None
 
-    
-    for fmt in ['%B %d', '%b %d', '%d %B', '%d %b', '%m/%d/%Y', '%m/%d/%y', '%B %d %Y', '%b %d %Y', '%d %B %Y', '%d %b %Y']:
+    shape = parse_date_shape(value_lower)
+    if shape:
+        year, month, day = shape
         try:
-            parsed = datetime.strptime(value, fmt).date()
-            if fmt in ['%B %d', '%b %d', '%d %B', '%d %b']:
-                parsed = parsed.replace(year=today.year)
-                if parsed < today:
-                    return False, f"Sorry, '{value}' is a past date. Please enter a future date.", None
-            if parsed < today:
-                return False, "Sorry, I can't make reservations for past dates.", None
-            return True, None, parsed
+            parsed = date(year or today.year, month, day)
         except ValueError:
-            continue
-
-    return False, f"Sorry, '{value}' is not a valid date. Please enter a valid date.", None
-
+            shape = None
+    if not shape:
+        return False, f"Sorry, '{value}' is not a valid date. Please enter a valid date.", None
+    if parsed < today:
+        if year is None:
+            return False, f"Sorry, '{value}' is a past date. Please enter a future date.", None
+        return False, PAST_DATE_MSG, None
+    return True, None, parsed
+
+@lru_cache(maxsize=1024)
 def parse_time_input(value):
     """Convert natural language time to HH:MM format"""
     value = value.lower().strip()
 
-    
-    if re.match(r'^\d{1,2}:\d{2}$', value):
+    if TIME_24H_RE.match(value):
         return value
 
-    
-    match = re.match(r'^(\d{1,2})(?::(\d{2}))?\s*(am|pm)$', value)
+    match = TIME_AMPM_RE.match(value)
     if match:
         hour = int(match.group(1))
         minute = int(match.group(2)) if match.group(2) else 0
@@ -120,8 +219,7 @@ def parse_time_input(value):
             hour = 0
         return f"{hour:02d}:{minute:02d}"
 
-    
-    match = re.match(r'^(\d{1,2})$', value)
+    match = TIME_HOUR_RE.match(value)
     if match:
         hour = int(match.group(1))
         if 1 <= hour <= 9:
@@ -173,10 +271,137 @@ def validate_num_people(value):
         return False, f"Sorry, '{value}' is not a valid number."
 
 def handle_greeting(event):
-    return close({}, 'GreetingIntent', 'Fulfilled', 'Hi there, how can I help?')
+    return close({}, 'GreetingIntent', 'Fulfilled', GREETING_REPLY)
 
 def handle_thankyou(event):
-    return close({}, 'ThankYouIntent', 'Fulfilled', "You're welcome! Have a great day!")
+    return close({}, 'ThankYouIntent', 'Fulfilled', THANKYOU_REPLY)
+
+def extract_slots(text):
+    """Returns {slot name: raw value} for every slot recognizable in text."""
+    found = {}
+    for slot_name, pattern in EXTRACTORS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        value = next((g for g in match.groups() if g), match.group(0))
+        if slot_name == 'DiningDate':
+            value = ' '.join(DATE_SUFFIX_RE.sub(' ', value).split())
+        elif slot_name == 'NumberOfPeople':
+            value = NUMBER_WORDS.get(value.lower(), value)
+        found[slot_name] = value
+        text = text[:match.start()] + ' ' * (match.end() - match.start()) + text[match.end():]
+    return found
+
+def collect_extracted(user_input, slots, session_attrs):
+    """Confirms every still-missing slot found in user_input, reusing the
+    per-slot collectors. Returns {slot name: error} for the values that were
+    found but rejected, or None when nothing was recognized."""
+    extracted = extract_slots(user_input)
+    errors = {}
+    handled = False
+    for slot_name, key, collect, _ in SLOTS:
+        if session_attrs.get(key) or slot_name not in extracted:
+            continue
+        handled = True
+        error_msg = collect(extracted[slot_name], slots, session_attrs)
+        if error_msg:
+            errors[error_slot(slot_name, key, session_attrs)] = error_msg
+    return errors if handled else None
+
+def error_slot(slot_name, key, session_attrs):
+    """The slot a collector's error is about: its own, unless it confirmed
+    its slot and rejected a dependent one (a time that has passed on the
+    new date), in which case the next slot still missing."""
+    if session_attrs.get(key):
+        return next_slot(session_attrs)[0]
+    return slot_name
+
+def collect_location(user_input, slots, session_attrs):
+    if TRIGGER_RE.search(user_input.lower()):
+        return "Where would you like to dine?"
+    place = geo.lookup(user_input)
+    if place:
+        session_attrs['confirmedLocation'] = place.name
+        session_attrs['confirmedGeohash'] = place.cell
+        return None
+    return (f"Sorry, I can't fulfill requests for {user_input}. "
+            f"Please enter a New York City borough or neighborhood.")
+
+def collect_cuisine(user_input, slots, session_attrs):
+    if user_input.lower() in VALID_CUISINES:
+        session_attrs['confirmedCuisine'] = user_input.capitalize()
+        return None
+    return (f"Sorry, I don't have suggestions for {user_input} cuisine. "
+            f"I support Chinese, Italian, Japanese, Mexican, and Indian. "
+            f"Which would you like?")
+
+def collect_date(user_input, slots, session_attrs):
+    slot_date = get_slot_value(slots, 'DiningDate')
+    is_valid, error_msg, parsed_date = validate_date(slot_date if slot_date else user_input)
+    if not is_valid and slot_date and slot_date != user_input:
+        is_valid, _, parsed_date = validate_date(user_input)
+    if not is_valid:
+        return error_msg
+    session_attrs['confirmedDate'] = parsed_date.strftime('%Y-%m-%d')
+    session_attrs['displayDate'] = user_input
+    # A time confirmed before the date could not be checked against it.
+    if session_attrs.get('confirmedTime'):
+        is_valid, error_msg = validate_time(session_attrs['confirmedTime'], session_attrs['confirmedDate'])
+        if not is_valid:
+            del session_attrs['confirmedTime']
+            return error_msg
+    return None
+
+def collect_time(user_input, slots, session_attrs):
+    time_to_validate = get_slot_value(slots, 'DiningTime') or parse_time_input(user_input)
+    if not time_to_validate:
+        return (f"Sorry, '{user_input}' is not a valid time. "
+                f"Please enter a valid time.")
+    is_valid, error_msg = validate_time(time_to_validate, session_attrs.get('confirmedDate'))
+    if not is_valid:
+        return error_msg
+    session_attrs['confirmedTime'] = time_to_validate
+    return None
+
+def collect_people(user_input, slots, session_attrs):
+    is_valid, error_msg = validate_num_people(user_input)
+    if not is_valid:
+        return error_msg
+    session_attrs['confirmedPeople'] = str(int(float(user_input)))
+    return None
+
+def collect_email(user_input, slots, session_attrs):
+    is_valid, error_msg = validate_email(user_input)
+    if not is_valid:
+        return error_msg
+    session_attrs['confirmedEmail'] = user_input.lower()
+    return None
+
+# Slots in the order they are collected: (slot name, session attribute that
+# holds the confirmed value, collector, prompt). A collector validates the
+# user's input, stores it on success and otherwise returns the message to
+# re-elicit the slot with.
+SLOTS = [
+    ('Location',       'confirmedLocation', collect_location,
+        "Where would you like to dine?"),
+    ('Cuisine',        'confirmedCuisine',  collect_cuisine,
+        "What cuisine are you in the mood for? "
+        "I support Chinese, Italian, Japanese, Mexican, and Indian."),
+    ('DiningDate',     'confirmedDate',     collect_date,
+        "When would you like the reservation for?"),
+    ('DiningTime',     'confirmedTime',     collect_time,
+        "What time would you like to dine?"),
+    ('NumberOfPeople', 'confirmedPeople',   collect_people,
+        "How many people will be dining?"),
+    ('Email',          'confirmedEmail',    collect_email,
+        "Almost done! What email should I send the suggestions to?"),
+]
+
+def next_slot(session_attrs):
+    for slot in SLOTS:
+        if not session_attrs.get(slot[1]):
+            return slot
+    return None
 
 def handle_dining(event):
     intent_name = event['sessionState']['intent']['name']
@@ -185,129 +410,55 @@ def handle_dining(event):
     source = event.get('invocationSource', '')
     user_input = event.get('inputTranscript', '').strip()
 
-    
-    confirmed_location = session_attrs.get('confirmedLocation')
-    confirmed_cuisine  = session_attrs.get('confirmedCuisine')
-    confirmed_date     = session_attrs.get('confirmedDate')
-    confirmed_time     = session_attrs.get('confirmedTime')
-    confirmed_people   = session_attrs.get('confirmedPeople')
-    confirmed_email    = session_attrs.get('confirmedEmail')
-
-    
-    if not confirmed_location:
-        collecting = 'Location'
-    elif not confirmed_cuisine:
-        collecting = 'Cuisine'
-    elif not confirmed_date:
-        collecting = 'DiningDate'
-    elif not confirmed_time:
-        collecting = 'DiningTime'
-    elif not confirmed_people:
-        collecting = 'NumberOfPeople'
-    elif not confirmed_email:
-        collecting = 'Email'
-    else:
-        collecting = None
-
+    errors = {}
+    collecting = next_slot(session_attrs)
     if collecting and source == 'DialogCodeHook':
-
-        if collecting == 'Location':
-            trigger_words = ['nearby', 'places', 'restaurant', 'food', 'eat',
-                           'dine', 'dinner', 'lunch', 'breakfast', 'suggestions',
-                           'help', 'hungry', 'recommend']
-            if any(word in user_input.lower() for word in trigger_words):
-                return elicit_slot(session_attrs, intent_name, slots, 'Location',
-                    "Where would you like to dine?")
-            elif user_input.lower() in VALID_LOCATIONS:
-                session_attrs['confirmedLocation'] = user_input
-            else:
-                return elicit_slot(session_attrs, intent_name, slots, 'Location',
-                    f"Sorry, I can't fulfill requests for {user_input}. "
-                    f"Please enter a valid location.")
-
-        elif collecting == 'Cuisine':
-            if user_input.lower() in VALID_CUISINES:
-                session_attrs['confirmedCuisine'] = user_input.capitalize()
-            else:
-                return elicit_slot(session_attrs, intent_name, slots, 'Cuisine',
-                    f"Sorry, I don't have suggestions for {user_input} cuisine. "
-                    f"I support Chinese, Italian, Japanese, Mexican, and Indian. "
-                    f"Which would you like?")
-
-        elif collecting == 'DiningDate':
-            slot_date = get_slot_value(slots, 'DiningDate')
-            date_to_validate = slot_date if slot_date else user_input
-            is_valid, error_msg, parsed_date = validate_date(date_to_validate)
-            if is_valid:
-                session_attrs['confirmedDate'] = parsed_date.strftime('%Y-%m-%d')
-                session_attrs['displayDate'] = user_input
-            else:
-                if slot_date and slot_date != user_input:
-                    is_valid2, error_msg2, parsed_date2 = validate_date(user_input)
-                    if is_valid2:
-                        session_attrs['confirmedDate'] = parsed_date2.strftime('%Y-%m-%d')
-                        session_attrs['displayDate'] = user_input
-                    else:
-                        return elicit_slot(session_attrs, intent_name, slots, 'DiningDate', error_msg)
-                else:
-                    return elicit_slot(session_attrs, intent_name, slots, 'DiningDate', error_msg)
-
-        elif collecting == 'DiningTime':
-            slot_time = get_slot_value(slots, 'DiningTime')
-            if slot_time:
-                time_to_validate = slot_time
-            else:
-                time_to_validate = parse_time_input(user_input)
-
-            if not time_to_validate:
-                return elicit_slot(session_attrs, intent_name, slots, 'DiningTime',
-                    f"Sorry, '{user_input}' is not a valid time. "
-                    f"Please enter a valid time.")
-
-            is_valid, error_msg = validate_time(time_to_validate, session_attrs.get('confirmedDate'))
-            if is_valid:
-                session_attrs['confirmedTime'] = time_to_validate
-            else:
-                return elicit_slot(session_attrs, intent_name, slots, 'DiningTime', error_msg)
-
-        elif collecting == 'NumberOfPeople':
-            is_valid, error_msg = validate_num_people(user_input)
-            if is_valid:
-                session_attrs['confirmedPeople'] = str(int(float(user_input)))
-            else:
-                return elicit_slot(session_attrs, intent_name, slots, 'NumberOfPeople', error_msg)
-
-        elif collecting == 'Email':
-            is_valid, error_msg = validate_email(user_input)
-            if is_valid:
-                session_attrs['confirmedEmail'] = user_input.lower()
-            else:
-                return elicit_slot(session_attrs, intent_name, slots, 'Email', error_msg)
-
-    
-    all_confirmed = all([
-        session_attrs.get('confirmedLocation'),
-        session_attrs.get('confirmedCuisine'),
-        session_attrs.get('confirmedDate'),
-        session_attrs.get('confirmedTime'),
-        session_attrs.get('confirmedPeople'),
-        session_attrs.get('confirmedEmail')
-    ])
+        # Confirm everything the user gave at once; fall back to reading the
+        # whole input as the slot being collected when nothing was recognized.
+        slot_name, key, collect, _ = collecting
+        extracted_errors = collect_extracted(user_input, slots, session_attrs)
+        if extracted_errors is None:
+            error_msg = collect(user_input, slots, session_attrs)
+            if error_msg:
+                return elicit_slot(session_attrs, intent_name, slots,
+                                   error_slot(slot_name, key, session_attrs), error_msg)
+        else:
+            errors = extracted_errors
+            # A value Lex resolved for the slot being collected still counts.
+            if (not session_attrs.get(key) and slot_name not in errors
+                    and get_slot_value(slots, slot_name)):
+                error_msg = collect(user_input, slots, session_attrs)
+                if error_msg:
+                    errors[error_slot(slot_name, key, session_attrs)] = error_msg
+
+    all_confirmed = next_slot(session_attrs) is None
 
     if all_confirmed:
-        if SQS_QUEUE_URL:
+        request = {
+            'Location':       session_attrs['confirmedLocation'],
+            'Geohash':        session_attrs.get('confirmedGeohash', ''),
+            'Cuisine':        session_attrs['confirmedCuisine'],
+            'DiningDate':     session_attrs['confirmedDate'],
+            'DiningTime':     session_attrs['confirmedTime'],
+            'NumberOfPeople': session_attrs['confirmedPeople'],
+            'Email':          session_attrs['confirmedEmail']
+        }
+        # Lets LF2 push delivery status to the WebSocket connection the
+        # booking was made on (see LF0).
+        attributes = event.get('requestAttributes') or {}
+        if attributes.get('channel') == 'websocket' and attributes.get('connectionId'):
+            request['ConnectionId'] = attributes['connectionId']
+        queue = enqueuer_for(request)
+        if queue:
+            if not queue.submit(request):
+                metrics.count('DuplicateRequests')
             try:
-                sqs.send_message(
-                    QueueUrl=SQS_QUEUE_URL,
-                    MessageBody=json.dumps({
-                        'Location':       session_attrs['confirmedLocation'],
-                        'Cuisine':        session_attrs['confirmedCuisine'],
-                        'DiningDate':     session_attrs['confirmedDate'],
-                        'DiningTime':     session_attrs['confirmedTime'],
-                        'NumberOfPeople': session_attrs['confirmedPeople'],
-                        'Email':          session_attrs['confirmedEmail']
-                    })
-                )
+                with metrics.timer('SqsSend'):
+                    metrics.put('OutboxBacklog', queue.flush())
+                if queue.dropped:
+                    metrics.count('DroppedMessages', len(queue.dropped))
+                if dedup_key(request) in queue.dropped:
+                    raise RuntimeError('request rejected by SQS')
             except Exception as e:
                 print(f'SQS error: {str(e)}')
                 return close(session_attrs, intent_name, 'Failed',
@@ -329,30 +480,25 @@ def handle_dining(event):
             f"to {session_attrs['confirmedEmail']}. Enjoy your meal!")
 
     
-    if not session_attrs.get('confirmedLocation'):
-        return elicit_slot(session_attrs, intent_name, slots, 'Location',
-            "Where would you like to dine?")
-    elif not session_attrs.get('confirmedCuisine'):
-        return elicit_slot(session_attrs, intent_name, slots, 'Cuisine',
-            "What cuisine are you in the mood for? "
-            "I support Chinese, Italian, Japanese, Mexican, and Indian.")
-    elif not session_attrs.get('confirmedDate'):
-        return elicit_slot(session_attrs, intent_name, slots, 'DiningDate',
-            "When would you like the reservation for?")
-    elif not session_attrs.get('confirmedTime'):
-        return elicit_slot(session_attrs, intent_name, slots, 'DiningTime',
-            "What time would you like to dine?")
-    elif not session_attrs.get('confirmedPeople'):
-        return elicit_slot(session_attrs, intent_name, slots, 'NumberOfPeople',
-            "How many people will be dining?")
-    elif not session_attrs.get('confirmedEmail'):
-        return elicit_slot(session_attrs, intent_name, slots, 'Email',
-            "Almost done! What email should I send the suggestions to?")
-
-    return delegate(session_attrs, intent_name, slots)
+    slot_name, _, _, prompt = next_slot(session_attrs)
+    return elicit_slot(session_attrs, intent_name, slots, slot_name, errors.get(slot_name, prompt))
 
+@profiled('LF1')
 def lambda_handler(event, context):
-    print('Event:', json.dumps(event))
+    log_event(event)
+    with metrics.invocation():
+        return handle_event(event)
+
+def handle_event(event):
+    for queue in (priority_enqueuer, enqueuer):
+        if queue and queue.has_outbox():
+            try:
+                with metrics.timer('OutboxReplay'):
+                    metrics.put('OutboxBacklog', queue.flush())
+                if queue.dropped:
+                    metrics.count('DroppedMessages', len(queue.dropped))
+            except Exception as e:
+                print(f'Outbox replay error: {str(e)}')
     try:
         intent = event['sessionState']['intent']['name']
         if intent == 'GreetingIntent':
@@ -362,8 +508,7 @@ def lambda_handler(event, context):
         elif intent == 'DiningSuggestionsIntent':
             return handle_dining(event)
         elif intent == 'FallbackIntent':
-            return close({}, 'FallbackIntent', 'Fulfilled',
-                "Sorry, I didn't understand that. Type 'Hello' to get started!")
+            return close({}, 'FallbackIntent', 'Fulfilled', FALLBACK_REPLY)
         return close({}, intent, 'Fulfilled', 'How can I help you?')
     except Exception as e:
         print(f'Unhandled error: {str(e)}')
@@ -1,10 +1,16 @@
-import json, boto3, random, os, urllib.request, urllib.parse
-import base64
-from urllib.error import URLError
+import json, random, os, time
+from concurrent.futures import ThreadPoolExecutor
 
-sqs      = boto3.client('sqs',      region_name='us-east-1')
-dynamodb = boto3.resource('dynamodb',region_name='us-east-1')
-ses      = boto3.client('ses',       region_name='us-east-1')
+import geo
+from aws_clients import client, resource
+from connections import ConnectionRegistry
+from delivery import Delivery, pretty_date, render
+from local_engine import Snapshot
+from opensearch_client import OpenSearchClient, OpenSearchError
+from instrument import Metrics, log_event
+from profiling import profiled
+from scheduler import MAX_DELAY, Scheduler, queue_age, queue_url
+from ttl_cache import TTLCache
 
 SQS_URL    = os.environ.get('SQS_QUEUE_URL', '')
 ES_HOST    = os.environ.get('ES_HOST', '')
@@ -12,81 +18,433 @@ ES_USER    = os.environ.get('ES_USER', 'admin')
 ES_PASS    = os.environ.get('ES_PASS', '')
 FROM_EMAIL = os.environ.get('FROM_EMAIL', '')
 
-def es_search(cuisine):
-    url = f'{ES_HOST}/restaurants/_search'
-    query = json.dumps({'query': {'match': {'Cuisine': cuisine}}, 'size': 50}).encode()
-    credentials = base64.b64encode(f'{ES_USER}:{ES_PASS}'.encode()).decode()
-    req = urllib.request.Request(url, data=query,
-        headers={'Content-Type': 'application/json', 'Authorization': f'Basic {credentials}'},
-        method='GET')
-    with urllib.request.urlopen(req) as resp:
-        result = json.loads(resp.read())
-    hits = result.get('hits', {}).get('hits', [])
-    ids = [h['_source']['RestaurantID'] for h in hits]
-    return random.sample(ids, min(3, len(ids)))
+# The template is only created when missing, so a changed SUBJECT/TEXT in
+# delivery.py needs a new name.
+delivery = Delivery(lambda: client('ses'), FROM_EMAIL,
+    os.environ.get('SES_TEMPLATE', 'DiningSuggestions-v2'))
+
+es = OpenSearchClient(ES_HOST, ES_USER, ES_PASS,
+    connect_timeout=float(os.environ.get('ES_CONNECT_TIMEOUT', '2')),
+    read_timeout=float(os.environ.get('ES_READ_TIMEOUT', '5')),
+    max_retries=int(os.environ.get('ES_MAX_RETRIES', '2')),
+    pool_size=int(os.environ.get('MAX_WORKERS', '8')))
+
+# 'sample' draws random picks server-side; 'legacy' pulls 50 full hits.
+ES_QUERY_MODE       = os.environ.get('ES_QUERY_MODE', 'sample')
+CANDIDATE_POOL_SIZE = int(os.environ.get('CANDIDATE_POOL_SIZE', '500'))
+
+# Set when the index was loaded with the 'full' profile, whose documents carry
+# the email fields under Details; DynamoDB is then only read for gaps.
+ES_DENORMALIZED = os.environ.get('ES_DENORMALIZED', '') == '1'
+SOURCE_FIELDS   = ['RestaurantID', 'Details'] if ES_DENORMALIZED else ['RestaurantID']
+
+# 'local' answers from an in-process snapshot (load_opensearch.py snapshot)
+# instead of OpenSearch.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'opensearch')
+SNAPSHOT_PATH  = os.environ.get('SNAPSHOT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'restaurants.snap'))
+
+# Weighted ranking of the whole candidate pool instead of uniform sampling.
+# Needs features, so it applies to the local backend and to denormalized
+# OpenSearch documents.
+RANKING          = os.environ.get('RANKING', '') == '1'
+RANK_TEMPERATURE = float(os.environ.get('RANK_TEMPERATURE', '0.5'))
+if RANKING:
+    import ranking  # pulls in NumPy, so only imported when enabled
+    RANK_WEIGHTS = ranking.load_weights(os.environ.get('RANK_WEIGHTS', ''))
+EMAIL_FIELDS    = ['Name', 'Address']
+
+# Per-cuisine pool of CANDIDATE_POOL_SIZE random candidates; disabled unless
+# CANDIDATE_CACHE_TTL > 0. Ranking denormalized documents scores a whole
+# pool of full Details documents (500 by default, against 50 IDs per message
+# in legacy mode), so that mode caches pools for five minutes by default.
+candidate_cache = TTLCache(
+    maxsize=int(os.environ.get('CANDIDATE_CACHE_SIZE', '32')),
+    ttl=int(os.environ.get('CANDIDATE_CACHE_TTL', '300' if RANKING and ES_DENORMALIZED else '0')))
+
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '8'))
+
+# Same-day requests are handled first; requests further out than
+# SEND_LEAD_HOURS go back on the queue until they come due (0 disables).
+# MESSAGE_RETENTION_HOURS must match the queue's MessageRetentionPeriod
+# (SQS default 4 days) and DEFER_MAX_RECEIVES stay below its redrive
+# maxReceiveCount: requests deferred close to either are re-sent as new
+# messages so SQS never expires or dead-letters them.
+scheduler = Scheduler(
+    priority_window=float(os.environ.get('PRIORITY_WINDOW_HOURS', '6')) * 3600,
+    send_lead=float(os.environ.get('SEND_LEAD_HOURS', '48')) * 3600,
+    max_receives=int(os.environ.get('DEFER_MAX_RECEIVES', '6')),
+    retention=float(os.environ.get('MESSAGE_RETENTION_HOURS', '96')) * 3600,
+    margin=float(os.environ.get('RETENTION_MARGIN_HOURS', '2')) * 3600)
+
+TABLE_NAME        = os.environ.get('TABLE_NAME', 'yelp-restaurants')
+DETAIL_FIELDS     = ['BusinessID', 'Name', 'Address']
+BATCH_GET_LIMIT   = 100
+BATCH_GET_RETRIES = 5
+
+details_cache = TTLCache(
+    maxsize=int(os.environ.get('DETAIL_CACHE_SIZE', '2048')),
+    ttl=int(os.environ.get('DETAIL_CACHE_TTL', '3600')))
+
+# Recommendation sets per (Cuisine, Location, DiningDate, DiningTime), so
+# identical requests arriving close together share one search.
+REQUEST_FIELDS = ('Cuisine', 'Location', 'DiningDate', 'DiningTime')
+recommendation_cache = TTLCache(
+    maxsize=int(os.environ.get('RECOMMENDATION_CACHE_SIZE', '256')),
+    ttl=int(os.environ.get('RECOMMENDATION_TTL', '60')))
+
+metrics = Metrics('LF2')
+metrics.track_cache('Candidate', candidate_cache)
+metrics.track_cache('Details', details_cache)
+metrics.track_cache('Recommendation', recommendation_cache)
+
+@metrics.timed('OpenSearchSearch')
+def es_query(query):
+    return es.search('restaurants', query)
+
+_snapshot = None
+
+def local_snapshot():
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = Snapshot(SNAPSHOT_PATH)
+    return _snapshot
+
+def cuisine_query(cuisine, place=None, clause='term'):
+    """Cuisine query, bounded to place's radius via the geo_point the
+    loader writes in Location. On an index loaded without Location the
+    filter matches nothing, and recommend() searches everywhere instead."""
+    query = {clause: {'Cuisine': cuisine}}
+    if not place:
+        return query
+    return {'bool': {'filter': [query, {'geo_distance': {
+        'distance': f'{place.radius_km}km',
+        'Location': {'lat': place.lat, 'lon': place.lon},
+        'ignore_unmapped': True,
+    }}]}}
+
+def random_query(cuisine, place=None):
+    """cuisine_query in random order, so any `size` hits are a uniform
+    sample rather than the first documents in index order."""
+    return {'function_score': {
+        'query': cuisine_query(cuisine, place),
+        'random_score': {},
+        'boost_mode': 'replace',
+    }}
+
+def candidate_pool(cuisine, place=None):
+    key = (cuisine, place.name if place else '')
+    pool = candidate_cache.get(key)
+    if pool is None:
+        hits = es_query({
+            'query': random_query(cuisine, place),
+            '_source': SOURCE_FIELDS,
+            'size': CANDIDATE_POOL_SIZE,
+        })
+        pool = [h['_source'] for h in hits]
+        candidate_cache.set(key, pool)
+    return pool
+
+def es_search_sources(cuisine, k=3, people=None, place=None):
+    if SEARCH_BACKEND == 'local':
+        rank = None
+        if RANKING:
+            rank = lambda snap, rows, n: ranking.rank_rows(
+                snap, rows, n, people, RANK_WEIGHTS, RANK_TEMPERATURE)
+        near = (place.lat, place.lon, place.radius_km) if place else None
+        with metrics.timer('LocalSearch'):
+            return local_snapshot().search(cuisine, k, rank=rank, near=near)
+
+    if RANKING and ES_DENORMALIZED:
+        return ranking.rank_records(candidate_pool(cuisine, place), k, people, RANK_WEIGHTS,
+            RANK_TEMPERATURE, details=lambda s: s.get('Details') or {})
+
+    if candidate_cache.ttl > 0:
+        pool = candidate_pool(cuisine, place)
+        return random.sample(pool, min(k, len(pool)))
+
+    if ES_QUERY_MODE == 'sample':
+        # Let OpenSearch draw the random picks so only k documents come back.
+        hits = es_query({
+            'query': random_query(cuisine, place),
+            '_source': SOURCE_FIELDS,
+            'size': k,
+        })
+        return [h['_source'] for h in hits]
+
+    hits = es_query({'query': cuisine_query(cuisine, place, 'match'), 'size': 50})
+    sources = [h['_source'] for h in hits]
+    return random.sample(sources, min(k, len(sources)))
+
+def es_search(cuisine, k=3):
+    return [s['RestaurantID'] for s in es_search_sources(cuisine, k)]
+
+def find_restaurants(cuisine, k=3, people=None, place=None):
+    sources = es_search_sources(cuisine, k, people, place)
+    if not (ES_DENORMALIZED or SEARCH_BACKEND == 'local'):
+        return get_details_batch([s['RestaurantID'] for s in sources])
+
+    rests = [dict(s.get('Details') or {}, BusinessID=s['RestaurantID']) for s in sources]
+    missing = [r['BusinessID'] for r in rests if not all(r.get(f) for f in EMAIL_FIELDS)]
+    if missing:
+        fetched = {i['BusinessID']: i for i in get_details_batch(missing)}
+        rests = [dict(r, **fetched.get(r['BusinessID'], {})) for r in rests]
+        rests = [r for r in rests if all(r.get(f) for f in EMAIL_FIELDS)
+                 or r['BusinessID'] in fetched]
+    return rests
+
+def batch_get(keys):
+    names = {f'#f{i}': f for i, f in enumerate(DETAIL_FIELDS)}
+    request = {TABLE_NAME: {
+        'Keys': [{'BusinessID': k} for k in keys],
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names,
+    }}
+    items = []
+    for attempt in range(BATCH_GET_RETRIES + 1):
+        with metrics.timer('DynamoDBBatchGet'):
+            resp = resource('dynamodb').batch_get_item(RequestItems=request)
+        items.extend(resp.get('Responses', {}).get(TABLE_NAME, []))
+        request = resp.get('UnprocessedKeys') or {}
+        if not request:
+            return items
+        if attempt < BATCH_GET_RETRIES:
+            time.sleep(min(1.0, 0.05 * 2 ** attempt) * random.random())
+    print(f'Gave up on {len(request[TABLE_NAME]["Keys"])} unprocessed keys')
+    return items
+
+def get_details_batch(biz_ids):
+    found = {}
+    missing = []
+    for biz_id in dict.fromkeys(biz_ids):
+        item = details_cache.get(biz_id)
+        if item is None:
+            missing.append(biz_id)
+        else:
+            found[biz_id] = item
+    for i in range(0, len(missing), BATCH_GET_LIMIT):
+        for item in batch_get(missing[i:i + BATCH_GET_LIMIT]):
+            details_cache.set(item['BusinessID'], item)
+            found[item['BusinessID']] = item
+    return [found[b] for b in biz_ids if b in found]
 
 def get_details(biz_id):
-    table = dynamodb.Table('yelp-restaurants')
-    resp = table.get_item(Key={'BusinessID': biz_id})
-    return resp.get('Item', {})
+    items = get_details_batch([biz_id])
+    return items[0] if items else {}
 
-def send_email(to, cuisine, num, dining_date, time, restaurants):
-    lines = [f'{i+1}. {r.get("Name","?")}, located at {r.get("Address","?")}' 
-             for i, r in enumerate(restaurants)]
-    
-    # Format time nicely e.g. "7:00 PM"
-    try:
-        from datetime import datetime
-        pretty_time = datetime.strptime(time, '%H:%M').strftime('%I:%M %p')
-    except Exception:
-        pretty_time = time
+def request_key(body):
+    key = tuple(body.get(f, '') for f in REQUEST_FIELDS)
+    # Ranking favours places that suit the party size, so it is part of the key.
+    return key + (body.get('NumberOfPeople', '2'),) if RANKING else key
+
+def recommend(body):
+    key = request_key(body)
+    rests = recommendation_cache.get(key)
+    if rests is None:
+        cuisine, people = body.get('Cuisine', ''), body.get('NumberOfPeople', '2')
+        place = geo.place_of(body.get('Location', ''), body.get('Geohash', ''))
+        try:
+            rests = find_restaurants(cuisine, people=people, place=place)
+        except OpenSearchError as e:
+            # Location mapped as something other than a geo_point.
+            if not place or e.status != 400:
+                raise
+            print(f'Geo search failed ({str(e)[:200]}); searching everywhere')
+            rests = []
+        if not rests and place:
+            print(f'No {cuisine} restaurants near {place.name}; searching everywhere')
+            rests = find_restaurants(cuisine, people=people)
+        if rests:
+            recommendation_cache.set(key, rests)
+    return rests
+
+def send_email(to, requests):
+    """Sends one email to `to` covering every (body, restaurants) request."""
+    with metrics.timer('SesSend'):
+        failed = delivery.send([(to, render(requests))])
+    if failed:
+        raise RuntimeError(failed[to])
+
+def process_message(body):
+    email = body.get('Email', '')
+    rests = recommend(body)
+
+    if rests and email:
+        send_email(email, [(body, rests)])
+        print(f'Email sent to {email}')
+
+# Delivery status for requests made over the WebSocket chat (see LF0).
+registry = ConnectionRegistry()
+
+def notify(bodies, status, text_of):
+    """Pushes a status update to the WebSocket connections the requests
+    were made on."""
+    if not registry.endpoint:
+        return
+    updates = {(b['ConnectionId'], text_of(b)) for b in bodies if b.get('ConnectionId')}
+    for connection_id, text in updates:
+        try:
+            with metrics.timer('WebSocketPush'):
+                registry.push(connection_id, {'type': 'status', 'status': status, 'text': text})
+        except Exception as e:
+            print(f'Could not notify {connection_id}: {str(e)}')
+
+def requeue(record, body, delay):
+    """Re-sends a deferred request as a new message, which starts a new
+    retention period; the old record is then deleted as processed."""
+    url = queue_url(record.get('eventSourceARN'), SQS_URL)
+    body = dict(body, Requeued=int(body.get('Requeued', 0)) + 1)
+    message = {'QueueUrl': url, 'MessageBody': json.dumps(body)}
+    attributes = {name: {'DataType': a.get('dataType', 'String'), 'StringValue': a['stringValue']}
+                  for name, a in record.get('messageAttributes', {}).items() if 'stringValue' in a}
+    if attributes:
+        message['MessageAttributes'] = attributes
+    if url.endswith('.fifo'):
+        message['MessageGroupId'] = record.get('attributes', {}).get('MessageGroupId') or 'default'
+        message['MessageDeduplicationId'] = f"{record['messageId']}-{body['Requeued']}"
+    else:
+        message['DelaySeconds'] = min(MAX_DELAY, delay)
+    client('sqs').send_message(**message)
+
+def defer(deferred):
+    """Hides far-future records until they come due, or re-sends those whose
+    retention would run out first. Returns the messageIds deferred, those
+    re-sent, and the requests that could be neither, which are processed
+    now instead."""
+    ids, requeued, undeferred = [], [], []
+    for record, body, delay in deferred:
+        try:
+            if scheduler.resend(record, delay):
+                with metrics.timer('SqsRequeue'):
+                    requeue(record, body, delay)
+                requeued.append(record['messageId'])
+                continue
+            with metrics.timer('SqsDefer'):
+                client('sqs').change_message_visibility(
+                    QueueUrl=queue_url(record.get('eventSourceARN'), SQS_URL),
+                    ReceiptHandle=record['receiptHandle'],
+                    VisibilityTimeout=delay)
+            ids.append(record['messageId'])
+        except Exception as e:
+            print(f'Could not defer {record["messageId"]}: {str(e)}')
+            undeferred.append((record, body))
+    return ids, requeued, undeferred
+
+# DedupKeys (see enqueue.py) of requests emailed recently. LF1 only
+# suppresses duplicates within one container, so a retried Lex turn that
+# lands on another one enqueues the booking again; this skips the copy when
+# it reaches a container that delivered the first within DEDUP_WINDOW.
+delivered = TTLCache(
+    maxsize=int(os.environ.get('DELIVERED_CACHE_SIZE', '4096')),
+    ttl=int(os.environ.get('DEDUP_WINDOW', '600')))
 
-    # Format date nicely e.g. "March 5, 2026"
+def dedup_key_of(record):
+    return record.get('messageAttributes', {}).get('DedupKey', {}).get('stringValue')
+
+def handle_batch(records):
+    """Processes an SQS batch most urgent first, with one search per
+    distinct request_key and one email per recipient. A failed search fails
+    every record that shares it; a failed email fails every record merged
+    into it. Deferred records are reported as failures so SQS keeps them."""
+    failed = {}
+    requests, keys, duplicates = [], set(), 0
+    for record in records:
+        key = dedup_key_of(record)
+        if key and (key in keys or delivered.get(key)):
+            print(f'Skipping duplicate message {record["messageId"]} ({key[:12]})')
+            duplicates += 1
+            continue
+        keys.add(key)
+        try:
+            requests.append((record, json.loads(record['body'])))
+        except ValueError as e:
+            failed[record['messageId']] = f'bad body: {str(e)}'
+
+    due, deferred, lanes = scheduler.plan(requests)
+    for lane, age in queue_age(records, lanes).items():
+        metrics.put(f'{lane.title()}QueueAgeMax', age['max_age_s'], 'Seconds')
+        metrics.put(f'{lane.title()}Messages', age['count'])
+    deferred_ids, requeued_ids, undeferred = defer(deferred)
+    due += undeferred
+    first_deferral = set(deferred_ids) | set(requeued_ids)
+    notify([b for r, b, _ in deferred if r['messageId'] in first_deferral and not b.get('Requeued')
+            and r.get('attributes', {}).get('ApproximateReceiveCount', '1') == '1'],
+           'scheduled', lambda b: f"I'll email your {b.get('Cuisine', '')} suggestions for "
+                                  f"{pretty_date(b.get('DiningDate', ''))} to {b.get('Email', '')} "
+                                  f"closer to the day.")
+
+    by_key = {}
+    for record, body in due:
+        by_key.setdefault(request_key(body), []).append((record, body))
+
+    workers = max(1, min(MAX_WORKERS, len(by_key)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        searches = [(group, pool.submit(recommend, group[0][1])) for group in by_key.values()]
+        by_recipient = {}
+        for group, future in searches:
+            try:
+                rests = future.result()
+            except Exception as e:
+                failed.update((r['messageId'], str(e)) for r, _ in group)
+                continue
+            for record, body in group:
+                if rests and body.get('Email'):
+                    by_recipient.setdefault(body['Email'], []).append((record, body, rests))
+
+    # One bulk delivery for the whole batch rather than a call per recipient.
+    recipients = list(by_recipient.items())
     try:
-        from datetime import datetime
-        pretty_date = datetime.strptime(dining_date, '%Y-%m-%d').strftime('%B %d, %Y')
-    except Exception:
-        pretty_date = dining_date
-
-    body = (
-        f'Hello!\n\n'
-        f'Here are my top {cuisine} restaurant suggestions '
-        f'for {num} people on {pretty_date} at {pretty_time}:\n\n'
-        + '\n'.join(lines) +
-        '\n\nEnjoy your meal!'
-    )
-
-    ses.send_email(
-        Source=FROM_EMAIL,
-        Destination={'ToAddresses': [to]},
-        Message={
-            'Subject': {'Data': f'{cuisine} Restaurant Suggestions'},
-            'Body':    {'Text': {'Data': body}}
-        }
-    )
+        with metrics.timer('SesSend'):
+            errors = delivery.send([(to, render([(b, r) for _, b, r in items]))
+                                    for to, items in recipients])
+    except Exception as e:
+        errors = {to: str(e) for to, _ in recipients}
+    for to, items in recipients:
+        if to in errors:
+            failed.update((r['messageId'], errors[to]) for r, _, _ in items)
+        else:
+            print(f'Email sent to {to} ({len(items)} requests)')
+            for record, _, _ in items:
+                if dedup_key_of(record):
+                    delivered.set(dedup_key_of(record), True)
+    notify([b for to, items in recipients if to not in errors for _, b, _ in items],
+           'sent', lambda b: f"Your {b.get('Cuisine', '')} suggestions for "
+                             f"{pretty_date(b.get('DiningDate', ''))} are in your inbox at "
+                             f"{b.get('Email', '')}.")
+
+    for message_id, error in failed.items():
+        print(f'Failed message {message_id}: {error}')
+    metrics.count('FailedMessages', len(failed))
+    metrics.count('DeferredMessages', len(deferred_ids))
+    metrics.count('RequeuedMessages', len(requeued_ids))
+    metrics.count('DuplicateMessages', duplicates)
+    print(f'Processed {len(records) - len(failed) - len(deferred_ids)}/{len(records)} messages with '
+          f'{len(by_key)} searches and {len(by_recipient)} emails, deferred {len(deferred_ids)}, '
+          f're-sent {len(requeued_ids)}, skipped {duplicates} duplicates')
+    return {'batchItemFailures': [{'itemIdentifier': m} for m in [*failed, *deferred_ids]]}
 
+@profiled('LF2')
 def lambda_handler(event, context):
-    resp = sqs.receive_message(QueueUrl=SQS_URL, MaxNumberOfMessages=1)
+    log_event(event)
+    with metrics.invocation():
+        return handle_event(event)
+
+def handle_event(event):
+    # Invoked by an SQS event source mapping: the batch arrives in the event.
+    # ReportBatchItemFailures must be enabled on the mapping so that only the
+    # failed messages are redelivered.
+    records = (event or {}).get('Records')
+    if records:
+        return handle_batch(records)
+
+    with metrics.timer('SqsReceive'):
+        resp = client('sqs').receive_message(QueueUrl=SQS_URL, MaxNumberOfMessages=1)
     msgs = resp.get('Messages', [])
     if not msgs:
         return {'statusCode': 200, 'body': 'No messages'}
     
     msg  = msgs[0]
-    body = json.loads(msg['Body'])
-    
-    cuisine     = body.get('Cuisine', '')
-    email       = body.get('Email', '')
-    num         = body.get('NumberOfPeople', '2')
-    dining_date = body.get('DiningDate', '')
-    time        = body.get('DiningTime', 'your requested time')
-
-    ids   = es_search(cuisine)
-    rests = [get_details(i) for i in ids]
-    rests = [r for r in rests if r]
-
-    if rests and email:
-        send_email(email, cuisine, num, dining_date, time, rests)
-        print(f'Email sent to {email}')
+    process_message(json.loads(msg['Body']))
 
-    sqs.delete_message(QueueUrl=SQS_URL, ReceiptHandle=msg['ReceiptHandle'])
+    client('sqs').delete_message(QueueUrl=SQS_URL, ReceiptHandle=msg['ReceiptHandle'])
     return {'statusCode': 200, 'body': 'Done'}
\ No newline at end of file
@@ -0,0 +1,53 @@
+import threading
+
+REGION = 'us-east-1'
+
+_instances = {}
+_overrides = {}
+_lock = threading.Lock()
+
+def _create(kind, name, endpoint_url=None):
+    # boto3 itself is imported here rather than at module level: importing it
+    # is the largest part of a cold start, and some invocations need no client.
+    import boto3
+    factory = boto3.client if kind == 'client' else boto3.resource
+    if endpoint_url:
+        return factory(name, region_name=REGION, endpoint_url=endpoint_url)
+    return factory(name, region_name=REGION)
+
+def _get(kind, name, endpoint_url=None):
+    override = _overrides.get((kind, name))
+    if override is not None:
+        return override
+    key = (kind, name, endpoint_url)
+    instance = _instances.get(key)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                instance = _instances[key] = _create(kind, name, endpoint_url)
+    return instance
+
+def client(name, endpoint_url=None):
+    """Returns the boto3 client for `name` (and endpoint_url, for services
+    such as apigatewaymanagementapi that need one), creating it on first use
+    and reusing it for as long as the container stays warm."""
+    return _get('client', name, endpoint_url)
+
+def resource(name):
+    return _get('resource', name)
+
+def error_code(error):
+    """AWS error code of a botocore ClientError, or '' for anything else."""
+    return getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+
+def override(name, instance, kind='client'):
+    """Registers a stand-in to be returned instead of a real client, whatever
+    the endpoint."""
+    with _lock:
+        _overrides[(kind, name)] = instance
+
+def reset():
+    with _lock:
+        _instances.clear()
+        _overrides.clear()
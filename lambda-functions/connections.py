@@ -0,0 +1,84 @@
+import json
+import os
+import time
+
+from aws_clients import client, error_code, resource
+
+CONNECTIONS_TABLE = os.environ.get('CONNECTIONS_TABLE', '')
+# https://{api-id}.execute-api.{region}.amazonaws.com/{stage}; LF0 can also
+# take it from the WebSocket event, LF2 needs it configured.
+WS_ENDPOINT = os.environ.get('WS_ENDPOINT', '')
+# API Gateway closes WebSocket connections after two hours at most.
+CONNECTION_TTL = int(os.environ.get('CONNECTION_TTL', str(2 * 3600)))
+
+def endpoint_of(event):
+    """Management API endpoint of the WebSocket API that sent event."""
+    ctx = event.get('requestContext', {})
+    if ctx.get('domainName') and ctx.get('stage'):
+        return f"https://{ctx['domainName']}/{ctx['stage']}"
+    return WS_ENDPOINT
+
+class ConnectionRegistry:
+    """Open WebSocket connections, in a DynamoDB table with partition key
+    ConnectionId and TTL attribute ExpiresAt. Updates are pushed to the
+    connection a request came from, never to every client of an address;
+    connections that closed, or that API Gateway reports gone, are skipped
+    and dropped. Without a table, pushes go straight to API Gateway.
+
+    Messages pushed to clients are JSON objects with a 'type':
+      {'type': 'reply', 'messages': [...]}   the bot's replies, shaped like
+                                             BotResponse.messages
+      {'type': 'status', 'status': 'sent' | 'scheduled', 'text': '...'}
+    """
+
+    def __init__(self, table_name=CONNECTIONS_TABLE, endpoint=WS_ENDPOINT, ttl=CONNECTION_TTL):
+        self.table_name = table_name
+        self.endpoint = endpoint
+        self.ttl = ttl
+
+    @property
+    def enabled(self):
+        return bool(self.table_name)
+
+    def table(self):
+        return resource('dynamodb').Table(self.table_name)
+
+    def add(self, connection_id):
+        if not self.enabled:
+            return
+        now = int(time.time())
+        self.table().put_item(Item={'ConnectionId': connection_id,
+                                    'ConnectedAt': now, 'ExpiresAt': now + self.ttl})
+
+    def remove(self, connection_id):
+        if not self.enabled:
+            return
+        self.table().delete_item(Key={'ConnectionId': connection_id})
+
+    def is_open(self, connection_id):
+        if not self.enabled:
+            return True
+        item = self.table().get_item(Key={'ConnectionId': connection_id}).get('Item')
+        return bool(item) and int(item.get('ExpiresAt', 0)) > time.time()
+
+    def send(self, connection_id, payload, endpoint=None):
+        """Posts payload to one connection. Returns False if it is gone."""
+        endpoint = endpoint or self.endpoint
+        try:
+            client('apigatewaymanagementapi', endpoint_url=endpoint).post_to_connection(
+                ConnectionId=connection_id, Data=json.dumps(payload).encode())
+            return True
+        except Exception as e:
+            if error_code(e) == 'GoneException':
+                return False
+            raise
+
+    def push(self, connection_id, payload):
+        """Sends payload to the connection if it is still open; returns
+        whether it was delivered."""
+        if not (self.endpoint and connection_id) or not self.is_open(connection_id):
+            return False
+        if self.send(connection_id, payload):
+            return True
+        self.remove(connection_id)
+        return False
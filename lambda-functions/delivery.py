@@ -0,0 +1,148 @@
+import json
+import random
+import time
+from datetime import datetime
+from functools import lru_cache
+
+from aws_clients import error_code
+
+BULK_LIMIT = 50
+RETRY_STATUSES = frozenset(['AccountThrottled', 'TransientFailure', 'Throttling'])
+
+# Plain-text email, so values go in with triple braces: SES's Handlebars
+# would HTML-escape {{...}} ("Joe&#x27;s", "Chinese &amp; Italian").
+SUBJECT = '{{{cuisines}}} Restaurant Suggestions'
+TEXT = (
+    'Hello!\n\n'
+    '{{#each sections}}{{{heading}}}\n\n'
+    '{{#each lines}}{{{this}}}\n{{/each}}\n'
+    '{{/each}}'
+    'Enjoy your meal!'
+)
+
+@lru_cache(maxsize=512)
+def pretty_time(value):
+    """'19:00' -> '07:00 PM'; anything else is returned unchanged."""
+    try:
+        return datetime.strptime(value, '%H:%M').strftime('%I:%M %p')
+    except (TypeError, ValueError):
+        return value
+
+@lru_cache(maxsize=512)
+def pretty_date(value):
+    """'2026-03-05' -> 'March 05, 2026'; anything else is returned unchanged."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%B %d, %Y')
+    except (TypeError, ValueError):
+        return value
+
+def address_text(address):
+    return ', '.join(address) if isinstance(address, list) else address
+
+def render(requests):
+    """Template data for one email covering every (body, restaurants)
+    request; identical requests are listed once."""
+    sections = {}
+    for body, rests in requests:
+        heading = (f'Here are my top {body.get("Cuisine", "")} restaurant suggestions '
+                   f'for {body.get("NumberOfPeople", "2")} people on '
+                   f'{pretty_date(body.get("DiningDate", ""))} at '
+                   f'{pretty_time(body.get("DiningTime", "your requested time"))}:')
+        lines = [f'{i+1}. {r.get("Name", "?")}, located at {address_text(r.get("Address", "?"))}'
+                 for i, r in enumerate(rests)]
+        sections.setdefault((heading, tuple(lines)), {'heading': heading, 'lines': lines})
+    cuisines = ' & '.join(dict.fromkeys(body.get('Cuisine', '') for body, _ in requests))
+    return {'cuisines': cuisines, 'sections': list(sections.values())}
+
+class Delivery:
+    """Sends pre-rendered suggestion emails through an SES template.
+
+    The template is registered on first use per container. Messages go out
+    with send_bulk_templated_email in groups of BULK_LIMIT; entries SES
+    reports as throttled are retried one by one with send_templated_email
+    and jittered backoff.
+    """
+
+    def __init__(self, ses, source, template_name, max_retries=3, backoff=0.2):
+        self.ses = ses
+        self.source = source
+        self.template_name = template_name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.registered = False
+
+    def ensure_template(self):
+        if self.registered:
+            return
+        try:
+            self.ses().get_template(TemplateName=self.template_name)
+        except Exception as e:
+            if error_code(e) != 'TemplateDoesNotExist':
+                raise
+            try:
+                self.ses().create_template(Template={
+                    'TemplateName': self.template_name,
+                    'SubjectPart': SUBJECT,
+                    'TextPart': TEXT,
+                })
+            except Exception as e:
+                if error_code(e) != 'AlreadyExists':
+                    raise
+        self.registered = True
+
+    def send(self, messages):
+        """Sends [(to, template data)]. Returns {to: error} for the
+        recipients that could not be sent to."""
+        if not messages:
+            return {}
+        self.ensure_template()
+        failed, retry = {}, []
+        for i in range(0, len(messages), BULK_LIMIT):
+            group = messages[i:i + BULK_LIMIT]
+            try:
+                resp = self.ses().send_bulk_templated_email(
+                    Source=self.source,
+                    Template=self.template_name,
+                    DefaultTemplateData=json.dumps({'cuisines': '', 'sections': []}),
+                    Destinations=[{'Destination': {'ToAddresses': [to]},
+                                   'ReplacementTemplateData': json.dumps(data)}
+                                  for to, data in group])
+            except Exception as e:
+                if error_code(e) not in RETRY_STATUSES:
+                    failed.update((to, str(e)) for to, _ in group)
+                    continue
+                retry += group
+                continue
+            statuses = resp.get('Status', [])
+            # Entries SES returned no status for were not confirmed sent.
+            failed.update((to, 'SES returned no status') for to, _ in group[len(statuses):])
+            for (to, data), status in zip(group, statuses):
+                if status.get('Status') == 'Success':
+                    continue
+                if status.get('Status') in RETRY_STATUSES:
+                    retry.append((to, data))
+                else:
+                    failed[to] = f"{status.get('Status')}: {status.get('Error', '')}"
+        for to, data in retry:
+            error = self.send_one(to, data)
+            if error:
+                failed[to] = error
+        return failed
+
+    def send_one(self, to, data):
+        """Retries one throttled message; returns the last error or None."""
+        error = 'throttled by SES, not retried'
+        for attempt in range(self.max_retries):
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            try:
+                self.ses().send_templated_email(
+                    Source=self.source,
+                    Destination={'ToAddresses': [to]},
+                    Template=self.template_name,
+                    TemplateData=json.dumps(data))
+                return None
+            except Exception as e:
+                if error_code(e) not in RETRY_STATUSES:
+                    return str(e)
+                error = str(e)
+        return error
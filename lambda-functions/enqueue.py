@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from aws_clients import error_code
+from ttl_cache import TTLCache
+
+BATCH_LIMIT = 10
+PERMANENT_ERRORS = frozenset([
+    'AWS.SimpleQueueService.NonExistentQueue', 'QueueDoesNotExist', 'InvalidParameterValue',
+    'AccessDenied', 'AccessDeniedException', 'InvalidMessageContents',
+])
+
+def dedup_key(body):
+    """Content hash of a request: identical bookings get identical keys."""
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def is_transient(error):
+    return error_code(error) not in PERMANENT_ERRORS
+
+class Enqueuer:
+    """Buffers SQS sends and flushes them with send_message_batch.
+
+    Every message carries a content-hash DedupKey attribute (and a
+    MessageDeduplicationId on FIFO queues), and keys sent recently from this
+    container are not sent again, so a retried Lex turn does not enqueue the
+    same booking twice; LF2 skips DedupKeys it has delivered recently, which
+    covers duplicates sent from different containers. Transient failures are
+    retried with backoff; whatever still fails is appended to a local outbox
+    file that is replayed on the next flush, so the caller never has to fail
+    the conversation turn. Messages SQS rejects permanently are dropped, and
+    the last flush's are listed in `dropped` so the caller can report them.
+    """
+
+    def __init__(self, queue_url, sqs, outbox_path, max_attempts=3, backoff=0.05,
+                 dedup_window=600):
+        self.queue_url = queue_url
+        self.sqs = sqs
+        self.outbox_path = outbox_path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.recent = TTLCache(maxsize=4096, ttl=dedup_window)
+        self.pending = []
+        self.dropped = []
+        self.fifo = queue_url.endswith('.fifo')
+        self._lock = threading.Lock()
+        self._outbox_dirty = os.path.exists(outbox_path)
+
+    def submit(self, body):
+        """Buffers body for the next flush. Returns False for a duplicate."""
+        key = dedup_key(body)
+        if self.recent.get(key) or any(k == key for k, _ in self.pending):
+            print(f'Skipping duplicate enqueue {key[:12]}')
+            return False
+        self.pending.append((key, body))
+        return True
+
+    def has_outbox(self):
+        return self._outbox_dirty
+
+    def entry(self, key, body):
+        entry = {
+            'Id': key[:80],
+            'MessageBody': json.dumps(body),
+            'MessageAttributes': {'DedupKey': {'DataType': 'String', 'StringValue': key}},
+        }
+        if self.fifo:
+            entry['MessageDeduplicationId'] = key
+            entry['MessageGroupId'] = body.get('Email') or 'default'
+        return entry
+
+    def send_batch(self, batch):
+        """Sends up to BATCH_LIMIT (key, body) pairs; returns those that
+        failed transiently after all attempts. Keys rejected permanently are
+        added to self.dropped."""
+        for attempt in range(self.max_attempts):
+            try:
+                resp = self.sqs().send_message_batch(
+                    QueueUrl=self.queue_url, Entries=[self.entry(k, b) for k, b in batch])
+            except Exception as e:
+                print(f'SQS error (attempt {attempt + 1}): {str(e)}')
+                if not is_transient(e):
+                    self.dropped += [k for k, _ in batch]
+                    return []
+            else:
+                by_id = {k[:80]: (k, b) for k, b in batch}
+                for ok in resp.get('Successful', []):
+                    self.recent.set(by_id[ok['Id']][0], True)
+                retry = []
+                for failed in resp.get('Failed', []):
+                    print(f"SQS rejected {failed['Id'][:12]}: {failed.get('Code')} {failed.get('Message', '')}")
+                    if failed.get('SenderFault'):
+                        self.dropped.append(by_id[failed['Id']][0])
+                        continue
+                    retry.append(by_id[failed['Id']])
+                batch = retry
+                if not batch:
+                    return []
+            if attempt + 1 < self.max_attempts:
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        return batch
+
+    def read_outbox(self):
+        if not self._outbox_dirty:
+            return []
+        try:
+            with open(self.outbox_path) as f:
+                return [tuple(json.loads(line)) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def write_outbox(self, items):
+        if not items:
+            if os.path.exists(self.outbox_path):
+                os.remove(self.outbox_path)
+            self._outbox_dirty = False
+            return
+        tmp = f'{self.outbox_path}.tmp'
+        with open(tmp, 'w') as f:
+            for key, body in items:
+                f.write(json.dumps([key, body]) + '\n')
+        os.replace(tmp, self.outbox_path)
+        self._outbox_dirty = True
+        print(f'{len(items)} message(s) kept in outbox {self.outbox_path}')
+
+    def flush(self):
+        """Sends the outbox and everything submitted. Returns the number of
+        messages left in the outbox."""
+        with self._lock:
+            self.dropped = []
+            items, self.pending = self.read_outbox() + self.pending, []
+            seen, unique = set(), []
+            for key, body in items:
+                if key not in seen and not self.recent.get(key):
+                    seen.add(key)
+                    unique.append((key, body))
+            left = []
+            for i in range(0, len(unique), BATCH_LIMIT):
+                left += self.send_batch(unique[i:i + BATCH_LIMIT])
+            if left or self._outbox_dirty:
+                self.write_outbox(left)
+            return len(left)
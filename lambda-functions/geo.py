@@ -0,0 +1,139 @@
+import math
+from collections import namedtuple
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+DECODE = {c: i for i, c in enumerate(BASE32)}
+EARTH_KM = 6371.0088
+
+# Precision of the cells the loader and the snapshot grid index on. A
+# 5-character geohash is ~4.9 km x 4.9 km (about 4.9 km x 3.7 km in NYC).
+CELL_PRECISION = 5
+GEOHASH_PRECISION = 7
+
+Place = namedtuple('Place', 'name lat lon radius_km cell')
+
+# (aliases, canonical name, latitude, longitude, radius in km). The radius
+# bounds the search around the centre: boroughs are covered whole, and
+# neighbourhoods get a short walk around them.
+PLACES = [
+    (['new york', 'new york city', 'nyc', 'ny'], 'New York City', 40.7128, -74.0060, 30),
+    (['manhattan'], 'Manhattan', 40.7831, -73.9712, 11),
+    (['brooklyn', 'bk'], 'Brooklyn', 40.6501, -73.9496, 11),
+    (['queens'], 'Queens', 40.7282, -73.7949, 14),
+    (['bronx', 'the bronx'], 'The Bronx', 40.8448, -73.8648, 9),
+    (['staten island', 'si'], 'Staten Island', 40.5795, -74.1502, 12),
+    (['midtown'], 'Midtown', 40.7549, -73.9840, 2),
+    (['times square'], 'Times Square', 40.7580, -73.9855, 1.5),
+    (['soho'], 'SoHo', 40.7233, -74.0030, 1.5),
+    (['tribeca'], 'Tribeca', 40.7163, -74.0086, 1.5),
+    (['chelsea'], 'Chelsea', 40.7465, -74.0014, 1.5),
+    (['greenwich village', 'the village'], 'Greenwich Village', 40.7336, -74.0027, 1.5),
+    (['west village'], 'West Village', 40.7358, -74.0036, 1.5),
+    (['east village'], 'East Village', 40.7265, -73.9815, 1.5),
+    (['lower east side', 'les'], 'Lower East Side', 40.7150, -73.9843, 1.5),
+    (['chinatown'], 'Chinatown', 40.7158, -73.9970, 1),
+    (['little italy'], 'Little Italy', 40.7191, -73.9973, 1),
+    (['financial district', 'fidi'], 'Financial District', 40.7075, -74.0113, 1.5),
+    (['upper east side', 'ues'], 'Upper East Side', 40.7736, -73.9566, 2),
+    (['upper west side', 'uws'], 'Upper West Side', 40.7870, -73.9754, 2),
+    (['harlem'], 'Harlem', 40.8116, -73.9465, 2),
+    (['washington heights'], 'Washington Heights', 40.8417, -73.9394, 2),
+    (['williamsburg'], 'Williamsburg', 40.7081, -73.9571, 2),
+    (['dumbo'], 'DUMBO', 40.7033, -73.9881, 1),
+    (['brooklyn heights'], 'Brooklyn Heights', 40.6960, -73.9933, 1.5),
+    (['park slope'], 'Park Slope', 40.6710, -73.9814, 1.5),
+    (['bushwick'], 'Bushwick', 40.6944, -73.9213, 2),
+    (['greenpoint'], 'Greenpoint', 40.7305, -73.9515, 1.5),
+    (['astoria'], 'Astoria', 40.7644, -73.9235, 2),
+    (['long island city', 'lic'], 'Long Island City', 40.7447, -73.9485, 1.5),
+    (['flushing'], 'Flushing', 40.7675, -73.8331, 2),
+    (['jackson heights'], 'Jackson Heights', 40.7557, -73.8831, 1.5),
+    (['fordham'], 'Fordham', 40.8615, -73.8903, 1.5),
+    (['riverdale'], 'Riverdale', 40.8900, -73.9120, 2),
+    (['st george', 'st. george'], 'St. George', 40.6437, -74.0736, 1.5),
+]
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, x = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if x >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+def bounds(cell):
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in cell:
+        value = DECODE[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+def center(cell):
+    min_lat, min_lon, max_lat, max_lon = bounds(cell)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+def distance_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_KM * math.asin(math.sqrt(a))
+
+def covering(lat, lon, radius_km, precision=CELL_PRECISION):
+    """Geohash cells of the given precision covering the bounding box of the
+    circle, walking the box in steps of one cell."""
+    dlat = math.degrees(radius_km / EARTH_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    min_lat, min_lon, max_lat, max_lon = bounds(encode(lat, lon, precision))
+    step_lat, step_lon = max_lat - min_lat, max_lon - min_lon
+    cells = []
+    y = lat - dlat
+    while True:
+        x = lon - dlon
+        while True:
+            cells.append(encode(min(y, lat + dlat), min(x, lon + dlon), precision))
+            if x >= lon + dlon:
+                break
+            x += step_lon
+        if y >= lat + dlat:
+            break
+        y += step_lat
+    return list(dict.fromkeys(cells))
+
+GAZETTEER = {
+    alias: Place(name, lat, lon, radius, encode(lat, lon))
+    for aliases, name, lat, lon, radius in PLACES
+    for alias in aliases
+}
+
+def lookup(text):
+    """Place for a location name or alias, or None."""
+    return GAZETTEER.get(' '.join(str(text or '').lower().split()))
+
+def place_of(location, cell=''):
+    """Place for a queued request: by name first, else the centre of the
+    geohash cell LF1 resolved, with a neighbourhood-sized radius."""
+    place = lookup(location)
+    if place or not cell:
+        return place
+    lat, lon = center(cell)
+    return Place(location or cell, lat, lon, 2, cell)
@@ -0,0 +1,139 @@
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DiningConcierge')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+EVENT_LOG_SAMPLE_RATE = float(os.environ.get('EVENT_LOG_SAMPLE_RATE', '0.01'))
+EVENT_LOG_MAX_BYTES = int(os.environ.get('EVENT_LOG_MAX_BYTES', '2048'))
+
+# CloudWatch accepts at most 100 values per metric in one EMF document.
+EMF_MAX_VALUES = 100
+
+class Metrics:
+    """Collects one invocation's metrics and prints them as CloudWatch
+    embedded metric format (EMF) JSON, which CloudWatch Logs turns into
+    metrics without any API call.
+
+    Stage timers record '<stage>Latency' in milliseconds, one value per call,
+    so CloudWatch can report percentiles, and count '<stage>Errors' when the
+    stage raises. Tracked TTLCaches report '<name>CacheHitRate' over the
+    lookups made since the previous flush. Safe to use from worker threads.
+    """
+
+    def __init__(self, function, namespace=NAMESPACE, enabled=METRICS_ENABLED):
+        self.function = function
+        self.namespace = namespace
+        self.enabled = enabled
+        self._values = {}
+        self._units = {}
+        self._caches = {}
+        self._directives = {}
+        self._lock = threading.Lock()
+
+    def put(self, name, value, unit='Count'):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values.setdefault(name, []).append(value)
+            self._units[name] = unit
+
+    def count(self, name, n=1):
+        self.put(name, n)
+
+    def timer(self, stage):
+        return Timer(self, stage)
+
+    def timed(self, stage):
+        """Decorator form of timer()."""
+        def wrap(fn):
+            @functools.wraps(fn)
+            def timed_call(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+            return timed_call
+        return wrap
+
+    def track_cache(self, name, cache):
+        self._caches[name] = [cache, cache.hits, cache.misses]
+
+    def _cache_rates(self):
+        for name, entry in self._caches.items():
+            cache, hits, misses = entry
+            new_hits, new_misses = cache.hits - hits, cache.misses - misses
+            entry[1:] = [cache.hits, cache.misses]
+            if new_hits + new_misses:
+                self.put(f'{name}CacheHitRate', round(100 * new_hits / (new_hits + new_misses), 1), 'Percent')
+
+    def flush(self):
+        """Prints the collected metrics as EMF documents and starts over."""
+        if not self.enabled:
+            return
+        self._cache_rates()
+        with self._lock:
+            values, units = self._values, self._units
+            self._values, self._units = {}, {}
+        while values:
+            doc = {name: vals[:EMF_MAX_VALUES] for name, vals in values.items()}
+            print(f'{{"_aws":{{"Timestamp":{int(time.time() * 1000)},'
+                  f'"CloudWatchMetrics":{self._directive(values, units)}}},'
+                  f'"Function":{json.dumps(self.function)},{json.dumps(doc)[1:]}')
+            values = {n: v[EMF_MAX_VALUES:] for n, v in values.items() if len(v) > EMF_MAX_VALUES}
+
+    def _directive(self, values, units):
+        # The same few metric sets recur on every invocation, so their
+        # serialized EMF directive is cached.
+        key = tuple((n, units[n]) for n in values)
+        directive = self._directives.get(key)
+        if directive is None:
+            directive = json.dumps([{
+                'Namespace': self.namespace,
+                'Dimensions': [['Function']],
+                'Metrics': [{'Name': n, 'Unit': u} for n, u in key],
+            }])
+            self._directives[key] = directive
+        return directive
+
+    @contextmanager
+    def invocation(self):
+        """Times the whole invocation and flushes when it ends."""
+        try:
+            with self.timer('Invocation'):
+                yield
+        finally:
+            self.flush()
+
+class Timer:
+    """Context manager returned by Metrics.timer(); a plain class because it
+    runs around every downstream call."""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = round((time.perf_counter() - self.start) * 1000, 3)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.metrics.count(f'{self.stage}Errors')
+        self.metrics.put(f'{self.stage}Latency', elapsed, 'Milliseconds')
+        return False
+
+def log_event(event, sample_rate=EVENT_LOG_SAMPLE_RATE, max_bytes=EVENT_LOG_MAX_BYTES):
+    """Logs a sampled fraction of events, truncated to max_bytes. Unsampled
+    events are never serialized."""
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        return
+    text = json.dumps(event, default=str)
+    if len(text) > max_bytes:
+        text = f'{text[:max_bytes]}... ({len(text)} bytes)'
+    print('Event:', text)
@@ -0,0 +1,211 @@
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from decimal import Decimal
+
+import geo
+
+MAGIC = b'RSNAP001'
+ALIGN = 8
+
+# name -> (array typecode or 'str', function that extracts the value from a
+# DynamoDB item). Numeric columns are stored as packed arrays, strings as an
+# offsets array plus one UTF-8 blob.
+COLUMNS = {
+    'BusinessID':      ('str', lambda item: item['BusinessID']),
+    'Name':            ('str', lambda item: item.get('Name', '')),
+    'Address':         ('str', lambda item: format_address(item.get('Address', ''))),
+    'Rating':          ('f',   lambda item: float(item.get('Rating') or 0)),
+    'NumberOfReviews': ('I',   lambda item: int(item.get('NumberOfReviews') or 0)),
+    'Price':           ('B',   lambda item: price_tier(item.get('Price'))),
+    'Latitude':        ('d',   lambda item: coordinate(item, 'latitude')),
+    'Longitude':       ('d',   lambda item: coordinate(item, 'longitude')),
+}
+
+# Inverted indices: name -> function returning the lower-cased key of an item.
+# CuisineCell is the spatial grid: one posting list per cuisine and geohash
+# cell, so a nearby search reads only the cells around the place.
+INDICES = {
+    'Cuisine':      lambda item: str(item.get('Cuisine', '')).lower(),
+    'Neighborhood': lambda item: str(item.get('Neighborhood') or item.get('ZipCode') or '').lower(),
+    'CuisineCell':  lambda item: cuisine_cell(item),
+}
+
+def format_address(address):
+    if isinstance(address, (list, tuple)):
+        return ', '.join(str(a) for a in address if a)
+    return str(address)
+
+def price_tier(value):
+    if isinstance(value, str):
+        return min(value.strip().count('$'), 4)
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def coordinate(item, axis):
+    value = (item.get('Coordinates') or {}).get(axis)
+    return float(value) if isinstance(value, (int, float, Decimal, str)) and value != '' else float('nan')
+
+def cuisine_cell(item):
+    lat, lon = coordinate(item, 'latitude'), coordinate(item, 'longitude')
+    if lat != lat or lon != lon:
+        return ''
+    return f"{str(item.get('Cuisine', '')).lower()}:{geo.encode(lat, lon, geo.CELL_PRECISION)}"
+
+def write_snapshot(path, items):
+    """Writes items to a snapshot file; returns the number of rows."""
+    columns = {name: ([], []) if kind == 'str' else array(kind) for name, (kind, _) in COLUMNS.items()}
+    postings = {name: {} for name in INDICES}
+    rows = 0
+    for item in items:
+        for name, (kind, extract) in COLUMNS.items():
+            value = extract(item)
+            if kind == 'str':
+                columns[name][0].append(value.encode())
+            else:
+                columns[name].append(value)
+        for name, key_of in INDICES.items():
+            key = key_of(item)
+            if key:
+                postings[name].setdefault(key, array('I')).append(rows)
+        rows += 1
+
+    sections = []
+    header = {'rows': rows, 'byteorder': sys.byteorder, 'columns': {}, 'indices': {}}
+    for name, (kind, _) in COLUMNS.items():
+        if kind == 'str':
+            values = columns[name][0]
+            offsets = array('I', [0])
+            for v in values:
+                offsets.append(offsets[-1] + len(v))
+            header['columns'][name] = {'type': 'str', 'offsets': len(sections), 'data': len(sections) + 1}
+            sections += [offsets.tobytes(), b''.join(values)]
+        else:
+            header['columns'][name] = {'type': kind, 'data': len(sections)}
+            sections.append(columns[name].tobytes())
+    for name, keys in postings.items():
+        merged = array('I')
+        ranges = {}
+        for key, ids in sorted(keys.items()):
+            ranges[key] = [len(merged), len(ids)]
+            merged.extend(ids)
+        header['indices'][name] = {'data': len(sections), 'keys': ranges}
+        sections.append(merged.tobytes())
+
+    # Section offsets are relative to the end of the header, so they can be
+    # computed before the header's own length is known.
+    layout, pos = [], 0
+    for data in sections:
+        layout.append([pos, len(data)])
+        pos += len(data) + (-len(data) % ALIGN)
+    header['sections'] = layout
+    encoded = json.dumps(header).encode()
+    encoded += b' ' * (-(len(MAGIC) + 4 + len(encoded)) % ALIGN)
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        for data in sections:
+            f.write(data + b'\0' * (-len(data) % ALIGN))
+    os.replace(tmp, path)
+    return rows
+
+class Snapshot:
+    """Read-only view over a snapshot file. The file is memory-mapped and
+    columns are exposed as typed memoryviews, so opening it costs only the
+    header parse and pages are loaded on first touch."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a restaurant snapshot')
+        (size,) = struct.unpack_from('<I', self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._mm[start:start + size])
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was written on a {header["byteorder"]}-endian machine')
+        base = start + size
+        view = memoryview(self._mm)
+        sections = [view[base + off:base + off + length] for off, length in header['sections']]
+
+        self.rows = header['rows']
+        self._strings = {}
+        self._numbers = {}
+        for name, spec in header['columns'].items():
+            if spec['type'] == 'str':
+                self._strings[name] = (sections[spec['offsets']].cast('I'), sections[spec['data']])
+            else:
+                self._numbers[name] = sections[spec['data']].cast(spec['type'])
+        self._indices = {name: (sections[spec['data']].cast('I'), spec['keys'])
+                         for name, spec in header['indices'].items()}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        return self._numbers.get(name)
+
+    def string(self, name, row):
+        offsets, blob = self._strings[name]
+        return bytes(blob[offsets[row]:offsets[row + 1]]).decode()
+
+    def postings(self, index, key):
+        data, keys = self._indices[index]
+        start, count = keys.get(str(key).lower(), (0, 0))
+        return data[start:start + count]
+
+    def candidates(self, cuisine, neighborhood=None, near=None):
+        """Rows of the cuisine, optionally limited to a neighborhood key and
+        to within near=(lat, lon, radius_km)."""
+        if near and 'CuisineCell' in self._indices:
+            rows = [r for cell in geo.covering(*near)
+                    for r in self.postings('CuisineCell', f'{cuisine}:{cell}')]
+        else:
+            rows = self.postings('Cuisine', cuisine)
+        if neighborhood:
+            nearby = set(self.postings('Neighborhood', neighborhood))
+            rows = [r for r in rows if r in nearby]
+        if near:
+            lat, lon, radius_km = near
+            lats, lons = self._numbers['Latitude'], self._numbers['Longitude']
+            rows = [r for r in rows
+                    if geo.distance_km(lat, lon, lats[r], lons[r]) <= radius_km]
+        return rows
+
+    def record(self, row):
+        lat = self._numbers['Latitude'][row]
+        lon = self._numbers['Longitude'][row]
+        record = {name: self.string(name, row) for name in self._strings}
+        record['Rating'] = round(self._numbers['Rating'][row], 2)
+        record['NumberOfReviews'] = self._numbers['NumberOfReviews'][row]
+        if 'Price' in self._numbers and self._numbers['Price'][row]:
+            record['Price'] = '$' * self._numbers['Price'][row]
+        if lat == lat and lon == lon:
+            record['Coordinates'] = {'latitude': lat, 'longitude': lon}
+        return record
+
+    def search(self, cuisine, k=3, neighborhood=None, rank=None, near=None):
+        """Same contract as LF2.es_search_sources: k documents of the cuisine,
+        shaped like denormalized search hits. Picks are uniform unless rank,
+        a function (snapshot, rows, k) -> rows, is given."""
+        rows = self.candidates(cuisine, neighborhood, near)
+        if rank:
+            picks = rank(self, rows, k)
+        else:
+            picks = [rows[i] for i in random.sample(range(len(rows)), min(k, len(rows)))]
+        return [to_source(self.record(r)) for r in picks]
+
+    def close(self):
+        self._strings = self._numbers = self._indices = None
+        self._mm.close()
+
+def to_source(record):
+    details = {k: v for k, v in record.items() if k != 'BusinessID'}
+    return {'RestaurantID': record['BusinessID'], 'Details': details}
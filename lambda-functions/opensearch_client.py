@@ -0,0 +1,194 @@
+import base64
+import http.client
+import json
+import queue
+import random
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class OpenSearchError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f'OpenSearch returned {status}: {body}')
+        self.status = status
+        self.body = body
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and stays open for
+    `reset_timeout` seconds, after which a single trial call is let through."""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+class OpenSearchClient:
+    """Keep-alive HTTP client for OpenSearch.
+
+    Connections are pooled and reused across calls (and across warm Lambda
+    invocations when the client is kept at module level). Retriable statuses
+    and connection errors are retried with full-jitter backoff; repeated
+    failures trip a circuit breaker so callers fail fast.
+    """
+
+    def __init__(self, endpoint, user='admin', password='', connect_timeout=2.0,
+                 read_timeout=5.0, max_retries=3, backoff=0.1, max_backoff=2.0,
+                 pool_size=10, breaker=None):
+        parts = urlsplit(endpoint if '://' in endpoint else f'https://{endpoint}')
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        credentials = base64.b64encode(f'{user}:{password}'.encode()).decode()
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Basic {credentials}',
+            'Connection': 'keep-alive',
+        }
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        conn = cls(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _checkin(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _send(self, method, path, payload, headers):
+        conn, reused = self._checkout()
+        try:
+            conn.request(method, self.base_path + path, body=payload, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            # The server closed an idle pooled connection; retry on a fresh one.
+            conn = self._connect()
+            try:
+                conn.request(method, self.base_path + path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._checkin(conn)
+        return resp.status, data
+
+    def request(self, method, path, body=None, content_type=None):
+        """Returns (status, parsed body). Raises CircuitOpenError when the
+        breaker is open and OpenSearchError when retries are exhausted."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f'circuit open for {self.host}')
+        if body is None or isinstance(body, (bytes, str)):
+            payload = body.encode() if isinstance(body, str) else body
+        else:
+            payload = json.dumps(body).encode()
+        headers = self.headers
+        if content_type:
+            headers = dict(headers, **{'Content-Type': content_type})
+
+        # Any exit that is not a success counts as a failure, so an
+        # unexpected error cannot leave a half-open trial pending for good.
+        succeeded = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                error = None
+                try:
+                    status, data = self._send(method, path, payload, headers)
+                    if status not in RETRY_STATUSES:
+                        result = self._parse(status, data)
+                        succeeded = True
+                        return status, result
+                    error = OpenSearchError(status, data[:500].decode(errors='replace'))
+                except (OSError, socket.timeout, http.client.HTTPException) as e:
+                    error = e
+                if attempt < self.max_retries:
+                    time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            raise error
+        finally:
+            if succeeded:
+                self.breaker.success()
+            else:
+                self.breaker.failure()
+
+    @staticmethod
+    def _parse(status, data):
+        if not data:
+            return {}
+        try:
+            return json.loads(data)
+        except ValueError:
+            # e.g. the security plugin's plain-text 401
+            if status >= 400:
+                raise OpenSearchError(status, data[:500].decode(errors='replace'))
+            raise
+
+    def search(self, index, query):
+        status, result = self.request('POST', f'/{index}/_search', query)
+        if status >= 400:
+            raise OpenSearchError(status, result)
+        return result.get('hits', {}).get('hits', [])
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,128 @@
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+# With PROFILE_SAMPLE_RATE > 0 that fraction of invocations runs under
+# cProfile and tracemalloc, and each writes a .pstats file plus a .json
+# summary (hot functions, top allocation sites, peak memory) to PROFILE_DIR,
+# or to the sink given to set_sink(). other-scripts/profile_report.py
+# aggregates them. cProfile sees only the handler's thread, so LF2's worker
+# threads show up as time spent waiting on their futures.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR         = os.environ.get('PROFILE_DIR', '/tmp/profiles')
+PROFILE_TOP         = int(os.environ.get('PROFILE_TOP', '30'))
+PROFILE_FRAMES      = int(os.environ.get('PROFILE_FRAMES', '1'))
+# cProfile, pstats, tracemalloc and uuid are imported on the first profiled
+# invocation, so a handler with profiling off does not pay for them at cold
+# start.
+
+_active = threading.Lock()
+
+def write_to_directory(name, summary, profile, directory=None):
+    """Default sink: <directory>/<name>.pstats and <name>.json."""
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    profile.dump_stats(os.path.join(directory, f'{name}.pstats'))
+    with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+        json.dump(summary, f, indent=1)
+
+_sink = write_to_directory
+
+def set_sink(sink):
+    """sink(name, summary dict, cProfile.Profile) stores one profile."""
+    global _sink
+    _sink = sink
+
+def hot_functions(profile, top):
+    import pstats
+    stats = pstats.Stats(profile).stats
+    rows = [{'function': f'{path}:{line}({func})', 'calls': nc, 'primitive_calls': cc,
+             'tottime_ms': round(tt * 1000, 3), 'cumtime_ms': round(ct * 1000, 3)}
+            for (path, line, func), (cc, nc, tt, ct, _) in stats.items()]
+    rows.sort(key=lambda r: -r['tottime_ms'])
+    return rows[:top]
+
+def trace_filters():
+    import tracemalloc
+    return [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ]
+
+def allocations(before, after, top):
+    filters = trace_filters()
+    diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    return [{'location': str(d.traceback[0]), 'size_kib': round(d.size_diff / 1024, 2),
+             'count': d.count_diff}
+            for d in diff[:top] if d.size_diff > 0]
+
+def profiled(function, sample_rate=None):
+    """Decorator for lambda_handler. Returns the handler unchanged when
+    profiling is off, so it costs nothing unless enabled."""
+    rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    def wrap(handler):
+        if rate <= 0:
+            return handler
+
+        @functools.wraps(handler)
+        def profiled_handler(event, context):
+            # One profile at a time: a nested handler (or a concurrent one in
+            # the same process) would replace the active profiler's hooks.
+            if random.random() >= rate or not _active.acquire(blocking=False):
+                return handler(event, context)
+            try:
+                return run(function, handler, event, context)
+            finally:
+                _active.release()
+        return profiled_handler
+    return wrap
+
+def run(function, handler, event, context):
+    import cProfile
+    import tracemalloc
+    import uuid
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_FRAMES)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    base, _ = tracemalloc.get_traced_memory()
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    error = None
+    try:
+        profile.enable()
+        try:
+            return handler(event, context)
+        finally:
+            profile.disable()
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        name = f'{function}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}'
+        summary = {
+            'function': function,
+            'request_id': getattr(context, 'aws_request_id', None),
+            'timestamp': time.time(),
+            'duration_ms': round(duration_ms, 3),
+            'peak_kib': round((peak - base) / 1024, 2),
+            'error': error,
+            'hot_functions': hot_functions(profile, PROFILE_TOP),
+            'allocations': allocations(before, after, PROFILE_TOP),
+        }
+        try:
+            _sink(name, summary, profile)
+        except Exception as e:
+            print(f'Could not store profile {name}: {str(e)}')
@@ -0,0 +1,29 @@
+import re
+
+GREETING_REPLY = 'Hi there, how can I help?'
+THANKYOU_REPLY = "You're welcome! Have a great day!"
+FALLBACK_REPLY = "Sorry, I didn't understand that. Type 'Hello' to get started!"
+
+GREETINGS = frozenset([
+    'hi', 'hello', 'hey', 'hiya', 'howdy', 'hi there', 'hello there', 'hey there',
+    'good morning', 'good afternoon', 'good evening',
+])
+THANKS = frozenset([
+    'thanks', 'thank you', 'thx', 'ty', 'thanks a lot', 'thank you so much',
+    'thanks so much', 'many thanks', 'cheers',
+])
+
+NORMALIZE_RE = re.compile(r'[\s!.,?]+')
+NO_WORDS_RE = re.compile(r'^[\W_]*$')
+
+def classify(text):
+    """Returns (intent, reply) for stateless messages that can be answered
+    without Lex, or None. Only exact, unambiguous phrases are matched."""
+    normalized = NORMALIZE_RE.sub(' ', text.lower()).strip()
+    if normalized in GREETINGS:
+        return 'GreetingIntent', GREETING_REPLY
+    if normalized in THANKS:
+        return 'ThankYouIntent', THANKYOU_REPLY
+    if NO_WORDS_RE.match(text):
+        return 'FallbackIntent', FALLBACK_REPLY
+    return None
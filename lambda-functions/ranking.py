@@ -0,0 +1,109 @@
+import json
+import math
+import random
+import threading
+
+from local_engine import price_tier
+
+try:
+    import numpy as np
+except ImportError:  # Ranking degrades to uniform sampling without NumPy.
+    np = None
+
+# Feature weights; override any of them with RANK_WEIGHTS='{"price": -0.5}'.
+DEFAULT_WEIGHTS = {
+    'rating':   1.0,   # stars, centred on 3
+    'reviews':  0.6,   # log review count, scaled to ~[0, 1]
+    'price':   -0.2,   # price tier 1-4, centred on 2 (unknown counts as 2)
+    'capacity': 0.4,   # review volume as a proxy for room, scaled by party size
+}
+REVIEW_SCALE = math.log1p(2000)
+LARGE_PARTY = 10
+
+_local = threading.local()
+
+def load_weights(spec=''):
+    weights = dict(DEFAULT_WEIGHTS)
+    if spec:
+        weights.update({k: float(v) for k, v in json.loads(spec).items()})
+    return weights
+
+def party_size(value):
+    try:
+        return max(1, int(float(value)))
+    except (TypeError, ValueError):
+        return 2
+
+def rng():
+    # numpy Generators are not thread-safe; LF2 ranks from a thread pool.
+    if not hasattr(_local, 'rng'):
+        _local.rng = np.random.default_rng()
+    return _local.rng
+
+def score(rating, reviews, price, people, weights):
+    """Scores every candidate in one vectorised pass."""
+    rating = np.asarray(rating, dtype=np.float32)
+    log_reviews = np.log1p(np.asarray(reviews, dtype=np.float32)) / REVIEW_SCALE
+    price = np.asarray(price, dtype=np.float32)
+    price = np.where(price > 0, price, 2.0)
+    capacity = log_reviews * min(people / LARGE_PARTY, 1.0)
+    return (weights['rating'] * (rating - 3.0)
+            + weights['reviews'] * log_reviews
+            + weights['price'] * (price - 2.0)
+            + weights['capacity'] * capacity)
+
+def weighted_sample(scores, k, temperature=0.5, name_of=None):
+    """Draws k indices without replacement with probability proportional to
+    exp(score / temperature), using the Gumbel top-k trick. With name_of,
+    later picks sharing a name (chains) are skipped for diversity."""
+    n = len(scores)
+    if n == 0 or k <= 0:
+        return []
+    keys = np.asarray(scores, dtype=np.float64) / max(temperature, 1e-6) + rng().gumbel(size=n)
+    m = min(n, k * 3 if name_of else k)
+    top = np.argpartition(-keys, m - 1)[:m]
+    top = top[np.argsort(-keys[top])].tolist()
+    if not name_of:
+        return top
+    picks, seen = [], set()
+    for i in top:
+        name = name_of(i)
+        if name not in seen:
+            seen.add(name)
+            picks.append(i)
+            if len(picks) == k:
+                return picks
+    return picks + [i for i in top if i not in picks][:k - len(picks)]
+
+def rank_records(records, k, people, weights, temperature=0.5, details=lambda r: r):
+    """Picks k of the candidate records. details(record) must return a dict
+    carrying Rating, NumberOfReviews and optionally Price and Name."""
+    if np is None or not records:
+        return random.sample(records, min(k, len(records)))
+    rows = [details(r) for r in records]
+    scores = score([float(r.get('Rating') or 0) for r in rows],
+                   [float(r.get('NumberOfReviews') or 0) for r in rows],
+                   [price_tier(r.get('Price')) for r in rows],
+                   party_size(people), weights)
+    picks = weighted_sample(scores, k, temperature, lambda i: rows[i].get('Name'))
+    return [records[i] for i in picks]
+
+def rank_rows(snapshot, rows, k, people, weights, temperature=0.5):
+    """Same as rank_records but reads features straight from a local_engine
+    snapshot's columns; returns the picked row numbers."""
+    if not len(rows):
+        return []
+    if np is None:
+        return random.sample(list(rows), min(k, len(rows)))
+    idx = np.asarray(rows, dtype=np.uint32)
+
+    def column(name, dtype):
+        values = snapshot.column(name)
+        if values is None:
+            return np.zeros(len(idx), dtype=dtype)
+        return np.frombuffer(values, dtype=dtype)[idx]
+
+    scores = score(column('Rating', np.float32), column('NumberOfReviews', np.uint32),
+                   column('Price', np.uint8), party_size(people), weights)
+    picks = weighted_sample(scores, k, temperature, lambda i: snapshot.string('Name', int(idx[i])))
+    return [int(idx[i]) for i in picks]
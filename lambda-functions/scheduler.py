@@ -0,0 +1,122 @@
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+EST = ZoneInfo('America/New_York')
+LANES = ('priority', 'normal', 'deferred')
+MAX_VISIBILITY = 43200  # SQS caps visibility timeouts at 12 hours
+MIN_DEFER = 300
+MAX_DELAY = 900  # and per-message DelaySeconds at 15 minutes
+QUEUE_ARN_RE = re.compile(r'^arn:aws[\w-]*:sqs:([\w-]+):(\d+):(.+)$')
+
+@lru_cache(maxsize=1024)
+def dining_at(dining_date, dining_time):
+    """Epoch seconds of the booking, or None when the date is unusable.
+    A missing or odd time counts as the start of the day."""
+    try:
+        day = datetime.strptime(dining_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+    try:
+        at = datetime.strptime(dining_time, '%H:%M').time()
+        day = day.replace(hour=at.hour, minute=at.minute)
+    except (TypeError, ValueError):
+        pass
+    return day.replace(tzinfo=EST).timestamp()
+
+def queue_url(arn, default=''):
+    """SQS queue URL for an eventSourceARN."""
+    match = QUEUE_ARN_RE.match(arn or '')
+    if not match:
+        return default
+    region, account, name = match.groups()
+    return f'https://sqs.{region}.amazonaws.com/{account}/{name}'
+
+class Scheduler:
+    """Orders queued requests by time left until the booking.
+
+    Same-day requests, and any within priority_window seconds, go to the
+    'priority' lane. Requests more than send_lead seconds out go to the
+    'deferred' lane and are put back on the queue until they come due. A
+    send_lead of 0 turns deferral off.
+
+    Deferring by changing visibility neither extends a message's retention
+    nor stops its receive count from growing. resend() tells when a
+    deferral would run past the record's retention deadline (SentTimestamp
+    + retention, less margin) or the record has been received max_receives
+    times, which should stay below the queue's redrive maxReceiveCount; the
+    caller then re-sends the request as a new message instead.
+    """
+
+    def __init__(self, priority_window=6 * 3600, send_lead=48 * 3600, max_receives=6,
+                 retention=4 * 86400, margin=2 * 3600):
+        self.priority_window = priority_window
+        self.send_lead = send_lead
+        self.max_receives = max_receives
+        self.retention = retention
+        self.margin = margin
+
+    def resend(self, record, delay, now=None):
+        """True when record should be re-sent rather than hidden for delay
+        seconds."""
+        now = time.time() if now is None else now
+        attributes = record.get('attributes', {})
+        if int(attributes.get('ApproximateReceiveCount', '1')) >= self.max_receives:
+            return True
+        sent = attributes.get('SentTimestamp')
+        sent = int(sent) / 1000 if sent else now
+        return now + delay > sent + self.retention - self.margin
+
+    def seconds_until(self, body, now):
+        at = dining_at(body.get('DiningDate', ''), body.get('DiningTime', ''))
+        return None if at is None else at - now
+
+    def lane(self, body, now=None):
+        now = time.time() if now is None else now
+        until = self.seconds_until(body, now)
+        if until is None:
+            return 'normal'
+        today = datetime.fromtimestamp(now, EST).strftime('%Y-%m-%d')
+        if body.get('DiningDate') == today or until <= self.priority_window:
+            return 'priority'
+        if self.send_lead > 0 and until - self.send_lead > MIN_DEFER:
+            return 'deferred'
+        return 'normal'
+
+    def plan(self, requests, now=None):
+        """Splits [(record, body)] into requests due now, most urgent first,
+        and [(record, body, delay_seconds)] to defer. Returns (due, deferred,
+        lanes) where lanes maps messageId to its lane."""
+        now = time.time() if now is None else now
+        due, deferred, lanes = [], [], {}
+        for record, body in requests:
+            lane = self.lane(body, now)
+            lanes[record['messageId']] = lane
+            if lane == 'deferred':
+                delay = self.seconds_until(body, now) - self.send_lead
+                deferred.append((record, body, int(min(MAX_VISIBILITY, delay))))
+            else:
+                due.append((record, body))
+
+        def urgency(request):
+            record, body = request
+            until = self.seconds_until(body, now)
+            return LANES.index(lanes[record['messageId']]), float('inf') if until is None else until
+
+        due.sort(key=urgency)
+        return due, deferred, lanes
+
+def queue_age(records, lanes, now=None):
+    """Per-lane count and age in seconds (now - SentTimestamp) of records."""
+    now = time.time() if now is None else now
+    ages = {lane: [] for lane in LANES}
+    for record in records:
+        sent = record.get('attributes', {}).get('SentTimestamp')
+        lane = lanes.get(record['messageId'])
+        if sent and lane:
+            ages[lane].append(max(0.0, now - int(sent) / 1000))
+    return {lane: {'count': len(a), 'max_age_s': round(max(a), 1),
+                   'mean_age_s': round(sum(a) / len(a), 1)}
+            for lane, a in ages.items() if a}
@@ -1,50 +1,390 @@
+import argparse
 import boto3
-import requests
 import json
 import os
-from requests.auth import HTTPBasicAuth
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from boto3.dynamodb.types import TypeDeserializer
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions'))
+import geo
+from local_engine import coordinate, write_snapshot
+from opensearch_client import OpenSearchClient
 
 ENDPOINT = os.environ.get('OS_ENDPOINT', '')
 USER     = 'admin'
 PASS     = os.environ.get('OS_PASS', '')
 
-auth     = HTTPBasicAuth(USER, PASS)
-headers  = {'Content-Type': 'application/json'}
+TABLE_NAME     = os.environ.get('TABLE_NAME', 'yelp-restaurants')
+ALIAS          = 'restaurants'
+SCAN_SEGMENTS  = int(os.environ.get('SCAN_SEGMENTS', '4'))
+BULK_WORKERS   = int(os.environ.get('BULK_WORKERS', '4'))
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', str(5 * 1024 * 1024)))
+BULK_MAX_DOCS  = int(os.environ.get('BULK_MAX_DOCS', '1000'))
+
+# 'full' also stores what LF2 needs for the email (see DETAIL_FIELDS) so it can
+# answer from the search hits alone; 'minimal' indexes only ID and cuisine.
+INDEX_PROFILE  = os.environ.get('INDEX_PROFILE', 'full')
+DETAIL_FIELDS  = ['Name', 'Address', 'Rating', 'NumberOfReviews', 'Price', 'Coordinates']
 
 index_mapping = {
     'mappings': {
         'properties': {
             'RestaurantID': {'type': 'keyword'},
-            'Cuisine':      {'type': 'keyword'}
+            'Cuisine':      {'type': 'keyword'},
+            'Location':     {'type': 'geo_point'},
+            'Geohash':      {'type': 'keyword'}
         }
     }
 }
-r = requests.put(f'{ENDPOINT}/restaurants', auth=auth, headers=headers, json=index_mapping)
-print('Create index:', r.status_code, r.text)
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-table = dynamodb.Table('yelp-restaurants')
+geo_mapping = {'properties': {k: index_mapping['mappings']['properties'][k]
+                              for k in ('Location', 'Geohash')}}
+
+# Stored in _source only: a disabled object is neither parsed nor indexed.
+details_mapping = {'properties': {'Details': {'type': 'object', 'enabled': False}}}
+
+def profile_mapping():
+    if INDEX_PROFILE != 'full':
+        return index_mapping
+    properties = dict(index_mapping['mappings']['properties'], **details_mapping['properties'])
+    return {'mappings': {'properties': properties}}
+
+def scan_segment(segment, total_segments, out):
+    # boto3 resources are not thread-safe, so each segment gets its own.
+    table = boto3.session.Session().resource('dynamodb', region_name='us-east-1').Table(TABLE_NAME)
+    kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+    while True:
+        response = table.scan(**kwargs)
+        for item in response['Items']:
+            out.put(item)
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
-response = table.scan()
-items = response['Items']
-while 'LastEvaluatedKey' in response:
-    response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-    items.extend(response['Items'])
+def parallel_scan(total_segments=SCAN_SEGMENTS):
+    """Yields table items as the segment scanners produce them. The queue is
+    bounded so scanning never runs far ahead of indexing."""
+    out = queue.Queue(maxsize=BULK_MAX_DOCS * 2)
+    done = object()
+    errors = []
 
-print(f'Uploading {len(items)} restaurants to OpenSearch...')
-ok = 0
-for item in items:
+    def run(segment):
+        try:
+            scan_segment(segment, total_segments, out)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            out.put(done)
+
+    threads = [threading.Thread(target=run, args=(s,), daemon=True) for s in range(total_segments)]
+    for t in threads:
+        t.start()
+    remaining = total_segments
+    while remaining:
+        item = out.get()
+        if item is done:
+            remaining -= 1
+        else:
+            yield item
+    if errors:
+        raise errors[0]
+
+def plain(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, set, tuple)):
+        return [plain(v) for v in value]
+    return value
+
+def to_doc(item):
     doc = {
         'RestaurantID': item['BusinessID'],
         'Cuisine': item.get('Cuisine', '')
     }
-    r = requests.post(
-        f'{ENDPOINT}/restaurants/_doc',
-        auth=auth,
-        headers=headers,
-        json=doc
-    )
-    if r.status_code in [200, 201]:
-        ok += 1
-
-print(f'Done! {ok}/{len(items)} loaded.')
+    # geo_point for LF2's geo_distance filter, plus the precomputed geohash
+    # cell for prefix/term lookups by area.
+    lat, lon = coordinate(item, 'latitude'), coordinate(item, 'longitude')
+    if lat == lat and lon == lon:
+        doc['Location'] = {'lat': lat, 'lon': lon}
+        doc['Geohash'] = geo.encode(lat, lon)
+    if INDEX_PROFILE == 'full':
+        doc['Details'] = {f: plain(item[f]) for f in DETAIL_FIELDS if f in item}
+    return doc
+
+def index_actions(items):
+    for item in items:
+        yield 'index', item
+
+def bulk_batches(actions, index, max_bytes=BULK_MAX_BYTES, max_docs=BULK_MAX_DOCS):
+    """Groups (op, item) actions into _bulk NDJSON payloads of at most
+    max_bytes/max_docs. BusinessID is the document ID, so reruns overwrite
+    instead of duplicating."""
+    lines, size = [], 0
+    for op, item in actions:
+        meta = json.dumps({op: {'_index': index, '_id': item['BusinessID']}})
+        if op == 'delete':
+            entry = f'{meta}\n'.encode()
+        else:
+            entry = f'{meta}\n{json.dumps(to_doc(item), default=str)}\n'.encode()
+        if lines and (size + len(entry) > max_bytes or len(lines) >= max_docs):
+            yield b''.join(lines), len(lines)
+            lines, size = [], 0
+        lines.append(entry)
+        size += len(entry)
+    if lines:
+        yield b''.join(lines), len(lines)
+
+def send_batch(client, payload, count):
+    """Returns (number indexed, list of per-item errors)."""
+    try:
+        status, result = client.request('POST', '/_bulk', payload,
+                                        content_type='application/x-ndjson')
+    except Exception as e:
+        return 0, [str(e)] * count
+    if status >= 400:
+        return 0, [f'HTTP {status}: {json.dumps(result)[:200]}'] * count
+    errors = []
+    for entry in result.get('items', []):
+        op, outcome = next(iter(entry.items()))
+        if op == 'delete' and outcome.get('status') == 404:
+            continue
+        if outcome.get('error'):
+            errors.append(f"{outcome.get('_id')}: {outcome['error'].get('reason', outcome['error'])}")
+    return count - len(errors), errors
+
+def load(client, actions, index=ALIAS, workers=BULK_WORKERS):
+    ok = failed = batches = 0
+    start = time.monotonic()
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    lock = threading.Lock()
+
+    def run(batch_no, payload, count):
+        nonlocal ok, failed
+        try:
+            indexed, errors = send_batch(client, payload, count)
+        finally:
+            in_flight.release()
+        with lock:
+            ok += indexed
+            failed += len(errors)
+            elapsed = time.monotonic() - start
+            print(f'Batch {batch_no}: {indexed}/{count} indexed, '
+                  f'{ok} total, {ok / max(elapsed, 1e-9):.0f} docs/s')
+            for error in errors[:5]:
+                print(f'  error: {error}')
+            if len(errors) > 5:
+                print(f'  ... {len(errors) - 5} more errors')
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for payload, count in bulk_batches(actions, index):
+            in_flight.acquire()
+            batches += 1
+            pool.submit(run, batches, payload, count)
+
+    elapsed = time.monotonic() - start
+    print(f'Done! {ok}/{ok + failed} loaded in {batches} batches, '
+          f'{elapsed:.1f}s ({ok / max(elapsed, 1e-9):.0f} docs/s).')
+    return ok, failed
+
+class FileChangeFeed:
+    """Local stand-in for a DynamoDB stream: a JSONL file of stream records
+    ({"eventName", "dynamodb": {"Keys", "NewImage", "SequenceNumber"}}).
+    The checkpoint is the last applied sequence number."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def records(self, checkpoint):
+        last = int(checkpoint.get('file', -1))
+        with open(self.path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                seq = record['dynamodb']['SequenceNumber']
+                if int(seq) > last:
+                    yield 'file', seq, record
+
+class StreamChangeFeed:
+    """Reads a DynamoDB stream, resuming each shard after its checkpointed
+    sequence number."""
+
+    def __init__(self, stream_arn):
+        self.stream_arn = stream_arn
+        self.streams = boto3.client('dynamodbstreams', region_name='us-east-1')
+
+    def shards(self):
+        kwargs = {'StreamArn': self.stream_arn}
+        while True:
+            desc = self.streams.describe_stream(**kwargs)['StreamDescription']
+            yield from desc['Shards']
+            if 'LastEvaluatedShardId' not in desc:
+                return
+            kwargs['ExclusiveStartShardId'] = desc['LastEvaluatedShardId']
+
+    def records(self, checkpoint):
+        for shard in self.shards():
+            shard_id = shard['ShardId']
+            kwargs = {'StreamArn': self.stream_arn, 'ShardId': shard_id}
+            if shard_id in checkpoint:
+                kwargs.update(ShardIteratorType='AFTER_SEQUENCE_NUMBER',
+                              SequenceNumber=checkpoint[shard_id])
+            else:
+                kwargs['ShardIteratorType'] = 'TRIM_HORIZON'
+            iterator = self.streams.get_shard_iterator(**kwargs)['ShardIterator']
+            while iterator:
+                resp = self.streams.get_records(ShardIterator=iterator, Limit=1000)
+                for record in resp['Records']:
+                    yield shard_id, record['dynamodb']['SequenceNumber'], record
+                if not resp['Records']:
+                    break
+                iterator = resp.get('NextShardIterator')
+
+def change_actions(feed, checkpoint):
+    """Collapses the feed to the latest change per restaurant. Returns the
+    actions and the checkpoint to save once they are applied."""
+    deserializer = TypeDeserializer()
+    latest = {}
+    checkpoint = dict(checkpoint)
+    for key, seq, record in feed.records(checkpoint):
+        change = record['dynamodb']
+        keys = {k: deserializer.deserialize(v) for k, v in change['Keys'].items()}
+        if record['eventName'] == 'REMOVE':
+            latest[keys['BusinessID']] = ('delete', keys)
+        else:
+            image = {k: deserializer.deserialize(v) for k, v in change['NewImage'].items()}
+            latest[keys['BusinessID']] = ('index', image)
+        checkpoint[key] = seq
+    return list(latest.values()), checkpoint
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_checkpoint(path, checkpoint):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+def alias_targets(client):
+    status, result = client.request('GET', f'/_alias/{ALIAS}')
+    return list(result) if status == 200 else []
+
+def rebuild(client, keep):
+    """Builds a fresh versioned index, then points the alias at it in one
+    atomic _aliases call so LF2 never sees a half-built index."""
+    index = f"{ALIAS}_v{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+    settings = dict(profile_mapping(), settings={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+    status, result = client.request('PUT', f'/{index}', settings)
+    print('Create index:', index, status, json.dumps(result))
+    if status >= 400:
+        return False
+    ok, failed = load(client, index_actions(parallel_scan()), index)
+    if failed:
+        print(f'Not swapping alias: {failed} documents failed. {index} left in place.')
+        return False
+    client.request('PUT', f'/{index}/_settings', {'index': {'refresh_interval': None, 'number_of_replicas': None}})
+    client.request('POST', f'/{index}/_refresh')
+
+    old = alias_targets(client)
+    actions = [{'add': {'index': index, 'alias': ALIAS}}]
+    actions += [{'remove': {'index': o, 'alias': ALIAS}} for o in old]
+    status, result = client.request('GET', f'/{ALIAS}')
+    if status == 200 and ALIAS in result:
+        # A concrete index from before aliases were used holds the name.
+        actions.append({'remove_index': {'index': ALIAS}})
+    status, result = client.request('POST', '/_aliases', {'actions': actions})
+    print('Swap alias:', status, json.dumps(result))
+    if status >= 400:
+        return False
+
+    status, result = client.request('GET', f'/{ALIAS}_v*')
+    versions = sorted(result) if status == 200 else []
+    for stale in versions[:-keep] if keep > 0 else []:
+        if stale != index:
+            status, _ = client.request('DELETE', f'/{stale}')
+            print('Delete old index:', stale, status)
+    return True
+
+def sync(client, feed, checkpoint_path):
+    checkpoint = read_checkpoint(checkpoint_path)
+    actions, new_checkpoint = change_actions(feed, checkpoint)
+    print(f'Applying {len(actions)} changed restaurants...')
+    ok, failed = load(client, actions)
+    if failed:
+        print('Checkpoint not advanced; rerun to retry (writes are idempotent).')
+        return False
+    write_checkpoint(checkpoint_path, new_checkpoint)
+    return True
+
+def main():
+    global INDEX_PROFILE
+    parser = argparse.ArgumentParser(description='Load yelp-restaurants into OpenSearch.')
+    parser.add_argument('mode', nargs='?', default='load', choices=['load', 'rebuild', 'sync', 'snapshot'],
+        help='load: upsert every item into the restaurants index/alias; '
+             'rebuild: blue/green rebuild behind the alias; '
+             'sync: apply changes since the checkpoint; '
+             'snapshot: write a local_engine snapshot file instead of indexing')
+    parser.add_argument('--changes-file', help='JSONL file of DynamoDB stream records (sync)')
+    parser.add_argument('--stream-arn', default=os.environ.get('STREAM_ARN', ''),
+        help='DynamoDB stream ARN of the table (sync)')
+    parser.add_argument('--checkpoint', default='.sync_checkpoint.json')
+    parser.add_argument('--profile', choices=['full', 'minimal'], default=INDEX_PROFILE,
+        help='full stores email fields in each document; minimal indexes IDs only')
+    parser.add_argument('--keep', type=int, default=2, help='versioned indices to keep after a rebuild')
+    parser.add_argument('--output', default='restaurants.snap', help='snapshot file to write (snapshot)')
+    args = parser.parse_args()
+    INDEX_PROFILE = args.profile
+
+    if args.mode == 'snapshot':
+        start = time.monotonic()
+        rows = write_snapshot(args.output, parallel_scan())
+        print(f'Wrote {rows} restaurants to {args.output} in {time.monotonic() - start:.1f}s '
+              f'({os.path.getsize(args.output)} bytes).')
+        return
+
+    client = OpenSearchClient(ENDPOINT, USER, PASS, read_timeout=60, pool_size=BULK_WORKERS)
+
+    if args.mode == 'rebuild':
+        sys.exit(0 if rebuild(client, args.keep) else 1)
+
+    if args.mode == 'sync':
+        if args.changes_file:
+            feed = FileChangeFeed(args.changes_file)
+        elif args.stream_arn:
+            feed = StreamChangeFeed(args.stream_arn)
+        else:
+            parser.error('sync needs --changes-file or --stream-arn')
+        sys.exit(0 if sync(client, feed, args.checkpoint) else 1)
+
+    if not alias_targets(client):
+        status, result = client.request('PUT', f'/{ALIAS}', profile_mapping())
+        print('Create index:', status, json.dumps(result))
+    # Existing indices need the Location and Details mappings before
+    # documents carry them, or dynamic mapping would guess wrong types.
+    status, result = client.request('PUT', f'/{ALIAS}/_mapping', geo_mapping)
+    print('Update mapping:', status, json.dumps(result))
+    if status >= 400:
+        print('Location is already mapped with another type; run rebuild to reindex '
+              'with the current mapping.')
+        sys.exit(1)
+    if INDEX_PROFILE == 'full':
+        status, result = client.request('PUT', f'/{ALIAS}/_mapping', details_mapping)
+        print('Update mapping:', status, json.dumps(result))
+    print(f'Streaming {TABLE_NAME} into OpenSearch with {SCAN_SEGMENTS} scan segments '
+          f'and {BULK_WORKERS} bulk workers...')
+    load(client, index_actions(parallel_scan()))
+
+if __name__ == '__main__':
+    main()
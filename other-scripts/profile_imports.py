@@ -0,0 +1,68 @@
+"""Reports per-module import time of the Lambda handlers.
+
+Runs `python -X importtime -c "import LFx"` in a fresh interpreter for each
+handler and ranks the modules by cumulative and self time. With --budget-ms
+it exits non-zero when a handler's import exceeds the budget, so it can gate
+cold-start regressions:
+
+    python other-scripts/profile_imports.py LF1 LF2 --top 15 --budget-ms 150
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+LAMBDAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions')
+LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def profile(module):
+    """Returns [(module, self_us, cumulative_us, depth)] in import order."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         cwd=LAMBDAS, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in out.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+def report(module, rows, top):
+    total = next((cum for name, _, cum, _ in reversed(rows) if name == module), 0)
+    print(f'\n{module}: {total / 1000:.1f} ms total import time, {len(rows)} modules')
+    print(f'  {"cumulative ms":>13}  {"self ms":>8}  module')
+    for name, self_us, cum_us, depth in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f'  {cum_us / 1000:13.2f}  {self_us / 1000:8.2f}  {"  " * depth}{name}')
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=['LF0', 'LF1', 'LF2'])
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, help='fail if any handler imports slower than this')
+    parser.add_argument('--json', help='also write the raw rows to this file')
+    args = parser.parse_args()
+
+    results, over = {}, []
+    for module in args.modules:
+        rows = profile(module)
+        total = report(module, rows, args.top)
+        results[module] = {'total_ms': total / 1000,
+                           'modules': [{'module': n, 'self_us': s, 'cumulative_us': c}
+                                       for n, s, c, _ in rows]}
+        if args.budget_ms is not None and total / 1000 > args.budget_ms:
+            over.append(f'{module} ({total / 1000:.1f} ms)')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if over:
+        print(f'\nOver the {args.budget_ms} ms import budget: ' + ', '.join(over))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
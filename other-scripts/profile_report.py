@@ -0,0 +1,113 @@
+"""Aggregates the per-invocation profiles written by lambda-functions/profiling.py.
+
+Merges every .pstats file in the directory (optionally only one handler's)
+into a ranked hot-function report, and sums the allocation sites from the
+.json summaries:
+
+    PROFILE_SAMPLE_RATE=0.05 ...          # on the Lambda, then copy /tmp/profiles
+    python other-scripts/profile_report.py profiles/ --function LF2 --top 20
+"""
+import argparse
+import glob
+import json
+import os
+import pstats
+import re
+import statistics
+
+SORT_KEYS = {
+    'tottime': lambda r: -r['tottime_ms'],
+    'cumtime': lambda r: -r['cumtime_ms'],
+    'calls': lambda r: -r['calls'],
+}
+
+def load(directory, function):
+    """Profile paths, named <function>-<ms>-<id>.pstats; with function set,
+    only that handler's (LF0 does not pick up LF0-ws)."""
+    paths = glob.glob(os.path.join(directory, f'{function or ""}*.pstats'))
+    if function:
+        name = re.compile(rf'{re.escape(function)}-\d+-[0-9a-f]+\.pstats$')
+        paths = [p for p in paths if name.match(os.path.basename(p))]
+    return sorted(paths)
+
+def hot_functions(paths):
+    """Per-function totals across the profiles, with the number of profiled
+    invocations each function appeared in."""
+    totals = {}
+    for path in paths:
+        for (file, line, func), (cc, nc, tt, ct, _) in pstats.Stats(path).stats.items():
+            row = totals.setdefault((file, line, func), {
+                'function': f'{os.path.basename(file)}:{line}({func})',
+                'calls': 0, 'tottime_ms': 0.0, 'cumtime_ms': 0.0, 'invocations': 0})
+            row['calls'] += nc
+            row['tottime_ms'] += tt * 1000
+            # Recursive functions are counted once per outermost call.
+            row['cumtime_ms'] += ct * 1000
+            row['invocations'] += 1
+    return list(totals.values())
+
+def summaries(paths):
+    out = []
+    for path in paths:
+        try:
+            with open(path[:-len('.pstats')] + '.json') as f:
+                out.append(json.load(f))
+        except FileNotFoundError:
+            pass
+    return out
+
+def allocation_sites(summaries):
+    sites = {}
+    for summary in summaries:
+        for alloc in summary.get('allocations', []):
+            site = sites.setdefault(alloc['location'], {'location': alloc['location'],
+                                                        'size_kib': 0.0, 'count': 0, 'invocations': 0})
+            site['size_kib'] += alloc['size_kib']
+            site['count'] += alloc['count']
+            site['invocations'] += 1
+    return sorted(sites.values(), key=lambda s: -s['size_kib'])
+
+def report(rows, sites, runs, top, sort):
+    durations = sorted(s['duration_ms'] for s in runs)
+    peaks = sorted(s['peak_kib'] for s in runs)
+    if runs:
+        print(f'{len(runs)} invocations: median {statistics.median(durations):.1f} ms, '
+              f'max {durations[-1]:.1f} ms; peak memory median {statistics.median(peaks):.1f} KiB, '
+              f'max {peaks[-1]:.1f} KiB; {sum(1 for s in runs if s.get("error"))} raised')
+    total = sum(r['tottime_ms'] for r in rows) or 1
+    print(f'\nHot functions by {sort}:')
+    print(f'  {"tottime ms":>10}  {"share":>6}  {"cumtime ms":>10}  {"calls":>8}  {"seen in":>7}  function')
+    for r in sorted(rows, key=SORT_KEYS[sort])[:top]:
+        print(f'  {r["tottime_ms"]:10.2f}  {100 * r["tottime_ms"] / total:5.1f}%  '
+              f'{r["cumtime_ms"]:10.2f}  {r["calls"]:8d}  {r["invocations"]:7d}  {r["function"]}')
+    if sites:
+        print('\nAllocation sites (net growth per invocation, summed):')
+        print(f'  {"KiB":>10}  {"blocks":>8}  {"seen in":>7}  location')
+        for s in sites[:top]:
+            print(f'  {s["size_kib"]:10.1f}  {s["count"]:8d}  {s["invocations"]:7d}  {s["location"]}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', nargs='?', default='/tmp/profiles')
+    parser.add_argument('--function', help='only profiles of this handler, e.g. LF2')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='tottime')
+    parser.add_argument('--json', help='also write the aggregated rows to this file')
+    args = parser.parse_args()
+
+    paths = load(args.directory, args.function)
+    if not paths:
+        parser.exit(1, f'No profiles in {args.directory}\n')
+    rows = hot_functions(paths)
+    runs = summaries(paths)
+    sites = allocation_sites(runs)
+    report(rows, sites, runs, args.top, args.sort)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'profiles': len(paths),
+                       'functions': sorted(rows, key=SORT_KEYS[args.sort]),
+                       'allocations': sites}, f, indent=2)
+
+if __name__ == '__main__':
+    main()